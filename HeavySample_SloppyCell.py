@@ -1,14 +1,54 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import random
 import math
+import os
+import pickle
+import sys
 from collections import Counter
 
-from SloppyCell.ReactionNetworks import Network, Dynamics
-
-# Load SBML model using SloppyCell
-net = Network()
-net.loadSBMLFile('chen2004_biomd56.xml')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Yeast', 'Chen'))
+from ChenPipeline import CACHE_DIR, get_model_path, sbml_hash
+from PhenotypeIndex import PhenotypeHammingIndex, neighbourhood_report
+from SamplerInstrumentation import SamplerInstrumentation
+
+_net = None
+
+def _network_cache_path(model_path, cache_dir):
+    """Pickles are only valid for the SloppyCell and Python versions that wrote them."""
+    import SloppyCell
+    version = getattr(SloppyCell, '__version__', 'unknown')
+    return os.path.join(cache_dir, f"sloppycell_{sbml_hash(model_path)[:16]}_sc{version}"
+                                   f"_py{sys.version_info.major}{sys.version_info.minor}.pkl")
+
+def get_network(model_path=None, cache_dir=CACHE_DIR):
+    """Load the SloppyCell network once, from a pickle keyed by the SBML hash when cached."""
+    global _net
+    if _net is not None:
+        return _net
+
+    model_path = model_path or get_model_path()
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _network_cache_path(model_path, cache_dir)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    _net = pickle.load(f)
+                return _net
+            except Exception:
+                # Stale or corrupt cache: fall back to parsing the SBML
+                pass
+
+    from SloppyCell.ReactionNetworks import Network
+    _net = Network()
+    _net.loadSBMLFile(model_path)
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(_net, f)
+        os.replace(tmp_path, cache_path)
+    return _net
 
 multipliers = [0.25, 0.50, 0.75, 1.00, 1.25, 1.50, 1.75, 2.00]
 
@@ -22,14 +62,20 @@ def sample_parameters(net, wildtype=False):
         sampled[pid] = factor
     return sampled
 
-def simulate_and_extract(net, tmax=200, npoints=2001):
+def simulate_and_extract(net, tmax=200, npoints=2001, instr=None):
+    from SloppyCell.ReactionNetworks import Dynamics
+
     times = np.linspace(0, tmax, npoints)
     try:
         result = Dynamics.integrateNetwork(net, times)
     except Exception as e:
+        if instr is not None:
+            instr.count('integrator_failure')
         return None, None
     # Extract CLB2 trajectory
     if 'CLB2' not in result:
+        if instr is not None:
+            instr.count('missing_clb2')
         return None, None
     clb2 = result['CLB2']
     return times, clb2
@@ -67,85 +113,99 @@ def CLZ(x):
     else:
         return math.log2(n) / 2 * (Nw(x) + Nw(x[::-1]))
 
-# Main workflow
-wildtype = False  # Set to True for wildtype, False for randomized
-
-net_copy = net.copy()
-sampled_params = sample_parameters(net_copy, wildtype=wildtype)
-time, clb2 = simulate_and_extract(net_copy)
-
-if time is None or clb2 is None:
-    print("WARNING: Integration failed for this parameter set!")
-else:
-    encoding = up_down_encoding(time, clb2, nbins=40)
-    plt.plot(time, clb2, label="CLB2")
-    plt.xlabel("Time (min)")
-    plt.ylabel("Concentration")
-    plt.title(f"Chen model (CLB2 trajectory) {'wildtype' if wildtype else 'randomized'}")
-    plt.legend()
-    plt.show()
-
-    print("Sampled parameters (multipliers):")
-    for k, v in sampled_params.items():
-        print(f"{k}: {v}")
-
-    print("Up-Down encoding:", encoding[:120], "...")
-    print("Lempel-Ziv complexity (CLZ):", CLZ(encoding))
-
-# Sampling loop
-N = 5000
-encodings = []
-complexities = []
-skipped_count = 0
-
-for i in range(N):
-    net_sample = net.copy()
-    sample_parameters(net_sample)
-    time, clb2 = simulate_and_extract(net_sample)
+def main(N=5000, wildtype=False, show_plots=True, export_path=None):
+    """Demo sample, sampling loop, plots and wildtype rank (plots import matplotlib lazily).
+
+    export_path: JSON-lines file for periodic instrumentation snapshots (None: no file).
+    """
+    net = get_network()
+    if show_plots:
+        import ChenPlots
+
+    net_copy = net.copy()
+    sampled_params = sample_parameters(net_copy, wildtype=wildtype)
+    time, clb2 = simulate_and_extract(net_copy)
+
     if time is None or clb2 is None:
-        skipped_count += 1
-        continue
-    encoding = up_down_encoding(time, clb2, nbins=40)
-    encodings.append(encoding)
-    complexities.append(CLZ(encoding))
-    if (i+1) % 100 == 0:
-        print(f"Completed {i+1} samples | successful: {len(encodings)} | skipped: {skipped_count}")
-
-print(f"\nFinal results: {len(encodings)} successful, {skipped_count} skipped")
-print("Example encoding:", encodings[0][:120], "...")
-print("Example complexity:", complexities[0])
-print("Mean complexity:", np.mean(complexities))
-print("Std complexity:", np.std(complexities))
-
-plt.figure()
-plt.hist(complexities, bins=30, color='skyblue', edgecolor='black')
-plt.xlabel("Lempel-Ziv Complexity (CLZ)")
-plt.ylabel("Count")
-plt.title("Distribution of CLZ Complexity (CLB2 up-down encoding)")
-plt.show()
-
-# Cluster phenotypes and log-log plot
-phenotype_counts = Counter(encodings)
-frequencies = sorted(phenotype_counts.values(), reverse=True)
-ranks = np.arange(1, len(frequencies) + 1)
-
-plt.figure()
-plt.loglog(ranks, frequencies, marker='o', linestyle='none')
-plt.xlabel("Rank")
-plt.ylabel("Frequency")
-plt.title("Log-Log Plot of Phenotype String Frequency by Rank")
-plt.show()
-
-# Wildtype rank
-net_wt = net.copy()
-sample_parameters(net_wt, wildtype=True)
-time_wt, clb2_wt = simulate_and_extract(net_wt)
-encoding_wt = up_down_encoding(time_wt, clb2_wt, nbins=40)
-
-sorted_phenotypes = [k for k, v in sorted(phenotype_counts.items(), key=lambda item: item[1], reverse=True)]
-if encoding_wt in sorted_phenotypes:
-    wt_rank = sorted_phenotypes.index(encoding_wt) + 1
-    wt_freq = phenotype_counts[encoding_wt]
-    print(f"Wildtype phenotype rank: {wt_rank} (frequency: {wt_freq})")
-else:
-    print("Wildtype phenotype not found in sampled set.")
\ No newline at end of file
+        print("WARNING: Integration failed for this parameter set!")
+    else:
+        encoding = up_down_encoding(time, clb2, nbins=40)
+        if show_plots:
+            ChenPlots.plot_trajectory(
+                time, clb2, title=f"Chen model (CLB2 trajectory) {'wildtype' if wildtype else 'randomized'}")
+
+        print("Sampled parameters (multipliers):")
+        for k, v in sampled_params.items():
+            print(f"{k}: {v}")
+
+        print("Up-Down encoding:", encoding[:120], "...")
+        print("Lempel-Ziv complexity (CLZ):", CLZ(encoding))
+
+    # Sampling loop
+    encodings = []
+    complexities = []
+    skipped_count = 0
+
+    # Per-stage timing; set profile_every=k to cProfile every k-th sample
+    instr = SamplerInstrumentation(export_path=export_path, profile_every=0)
+
+    for i in range(N):
+        with instr.profile_sample(i):
+            with instr.stage('net_copy'):
+                net_sample = net.copy()
+            with instr.stage('sample_parameters'):
+                sample_parameters(net_sample)
+            with instr.stage('integrate'):
+                time, clb2 = simulate_and_extract(net_sample, instr=instr)
+            if time is None or clb2 is None:
+                skipped_count += 1
+                instr.sample_done()
+                continue
+            with instr.stage('up_down_encoding'):
+                encoding = up_down_encoding(time, clb2, nbins=40)
+            with instr.stage('CLZ'):
+                complexity = CLZ(encoding)
+            encodings.append(encoding)
+            complexities.append(complexity)
+        instr.sample_done()
+        if (i+1) % 100 == 0:
+            print(f"Completed {i+1} samples | successful: {len(encodings)} | skipped: {skipped_count}")
+
+    print(f"\nFinal results: {len(encodings)} successful, {skipped_count} skipped")
+    instr.report()
+    if export_path:
+        instr.export()
+    print("Example encoding:", encodings[0][:120], "...")
+    print("Example complexity:", complexities[0])
+    print("Mean complexity:", np.mean(complexities))
+    print("Std complexity:", np.std(complexities))
+
+    # Cluster phenotypes and log-log plot
+    phenotype_counts = Counter(encodings)
+    if show_plots:
+        ChenPlots.plot_complexity_distribution(complexities, bins=30)
+        ChenPlots.plot_rank_frequency(phenotype_counts)
+
+    # Wildtype rank
+    net_wt = net.copy()
+    sample_parameters(net_wt, wildtype=True)
+    time_wt, clb2_wt = simulate_and_extract(net_wt)
+    if time_wt is None:
+        print("Wildtype integration failed.")
+        return
+    encoding_wt = up_down_encoding(time_wt, clb2_wt, nbins=40)
+
+    sorted_phenotypes = [k for k, v in sorted(phenotype_counts.items(), key=lambda item: item[1], reverse=True)]
+    if encoding_wt in sorted_phenotypes:
+        wt_rank = sorted_phenotypes.index(encoding_wt) + 1
+        wt_freq = phenotype_counts[encoding_wt]
+        print(f"Wildtype phenotype rank: {wt_rank} (frequency: {wt_freq})")
+    else:
+        print("Wildtype phenotype not found in sampled set.")
+        if phenotype_counts:
+            # Closest observed phenotypes instead of an exact rank
+            index = PhenotypeHammingIndex.from_counter(phenotype_counts)
+            neighbourhood_report(index, encoding_wt, label="wildtype")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Importable Chen 2004 Sampling Pipeline
+Lazy model loading with an on-disk cache of the compiled RoadRunner model and
+parameter metadata (keyed by a hash of the SBML file), so workers and quick jobs
+start without re-parsing the SBML. Headless: plotting lives in ChenPlots.
+"""
+
+import hashlib
+import json
+import os
+import platform
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from VectorizedPhenotypes import STATUS_NAMES, VALID, MultiSpeciesPhenotypeStore, encode_species_matrix
+
+# === SIMULATION CONFIGURATION ===
+multipliers = [0.25, 0.50, 0.75, 1.00, 1.25, 1.50, 1.75, 2.00]
+DIVERGENCE_THRESHOLD = None     # Reject solutions exceeding this |value|, or None to allow all
+MAX_PERIOD_THRESHOLD = 300      # Reject periods longer than this (min), or None to allow all
+SIMULATION_TIME = 1000          # Total simulation time in minutes
+SIMULATION_POINTS = 1001        # Number of time points in simulation
+REDUCED_PRECISION = True        # Slightly looser integrator tolerances for speed
+READOUT_SPECIES = ['CLB2']
+ARCHIVE_STORAGE = "float32"     # Trajectory archive format: 'float64' (exact), 'float32', 'float16' or 'quantized16'
+ARCHIVE_DOWNSAMPLE = 1          # Keep every k-th time point in the trajectory archive
+
+MODEL_FILENAME = "chen2004_biomd56.xml"
+CACHE_DIR = os.environ.get(
+    "OXFORD_EVOLUTION_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "oxford_evolution")
+)
+
+def get_model_path():
+    """Get the path to the SBML model file (env override, next to this module, then known paths)."""
+    candidates = [
+        os.environ.get("CHEN_MODEL_PATH"),
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), MODEL_FILENAME),
+        "/home/gijs/Documents/OxfordEvolution/Yeast/Chen/chen2004_biomd56.xml",
+        "/Users/gijsbartholomeus/Documents/STUDIE/OxfordEvolution/code/Yeast/Chen/chen2004_biomd56.xml",
+        MODEL_FILENAME,
+        os.path.join("Chen", MODEL_FILENAME),
+        os.path.join("..", "Chen", MODEL_FILENAME),
+    ]
+    for path in candidates:
+        if path and os.path.exists(path):
+            return os.path.abspath(path)
+    raise FileNotFoundError(
+        f"Could not find {MODEL_FILENAME} in any of the expected locations:\n"
+        + "\n".join(f"  {p}" for p in candidates if p)
+        + f"\nCurrent working directory: {os.getcwd()}\nPlatform: {platform.system()}"
+    )
+
+def sbml_hash(model_path: str) -> str:
+    """SHA-256 of the SBML file contents (cache key)"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_kinetic_parameters(rr):
+    """Get list of kinetic parameters, excluding regulatory switches/flags."""
+    kinetic_params = []
+    excluded_params = []
+
+    for pid in rr.model.getGlobalParameterIds():
+        value = rr.getValue(pid)
+        param_lower = pid.lower()
+
+        # Exclude non-kinetic parameters (switches, flags, totals)
+        if (param_lower.endswith('t') and value in [0.0, 1.0]) or \
+           (param_lower.startswith('d') and param_lower.endswith('n')) or \
+           ('flag' in param_lower) or \
+           ('switch' in param_lower) or \
+           (value == 0.0) or \
+           (pid in ['cell']) or \
+           ('total' in param_lower and value in [0.0, 1.0]):
+            excluded_params.append(pid)
+        else:
+            kinetic_params.append(pid)
+
+    return kinetic_params, excluded_params
+
+def _import_roadrunner():
+    import roadrunner
+    # Silence RoadRunner log messages completely
+    roadrunner.Logger.setLevel(roadrunner.Logger.LOG_CRITICAL)
+    return roadrunner
+
+class ChenModel:
+    """Lazily loaded Chen model with cached compiled state and parameter metadata
+
+    Metadata (kinetic parameters, defaults, species) is available without compiling
+    the model; the RoadRunner instance is only created on first access to .rr.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, cache_dir: Optional[str] = CACHE_DIR,
+                 use_cache: bool = True):
+        self.model_path = model_path or get_model_path()
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache and cache_dir is not None
+        self._rr = None
+        self._metadata = None
+        self._sbml_hash = None
+        self.load_seconds = None
+        self.loaded_from_cache = False
+
+    # --- cache ---
+
+    @property
+    def sbml_hash(self) -> str:
+        if self._sbml_hash is None:
+            self._sbml_hash = sbml_hash(self.model_path)
+        return self._sbml_hash
+
+    def _cache_stem(self) -> str:
+        # Compiled state is only valid for the RoadRunner version that wrote it
+        roadrunner = _import_roadrunner()
+        version = getattr(roadrunner, '__version__', 'unknown')
+        return os.path.join(self.cache_dir, f"chen_{self.sbml_hash[:16]}_rr{version}")
+
+    def _metadata_path(self) -> str:
+        return os.path.join(self.cache_dir, f"chen_{self.sbml_hash[:16]}_metadata.json")
+
+    def _build_metadata(self, rr) -> Dict:
+        kinetic_params, excluded_params = get_kinetic_parameters(rr)
+        return {
+            'sbml_sha256': self.sbml_hash,
+            'model_path': self.model_path,
+            'kinetic_params': kinetic_params,
+            'excluded_params': excluded_params,
+            'default_values': {pid: rr.getValue(pid) for pid in rr.model.getGlobalParameterIds()},
+            'floating_species': list(rr.model.getFloatingSpeciesIds()),
+        }
+
+    @property
+    def metadata(self) -> Dict:
+        """Parameter metadata, read from the JSON cache when possible"""
+        if self._metadata is None:
+            path = self._metadata_path() if self.use_cache else None
+            if path and os.path.exists(path):
+                with open(path) as f:
+                    self._metadata = json.load(f)
+            else:
+                self._metadata = self._build_metadata(self.rr)
+                if path:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, 'w') as f:
+                        json.dump(self._metadata, f)
+                    os.replace(tmp_path, path)
+        return self._metadata
+
+    @property
+    def rr(self):
+        """RoadRunner instance, restored from the compiled-state cache when available"""
+        if self._rr is None:
+            self._rr = self._load()
+            if REDUCED_PRECISION:
+                self._rr.integrator.absolute_tolerance = 1e-8
+                self._rr.integrator.relative_tolerance = 1e-6
+        return self._rr
+
+    def _load(self):
+        roadrunner = _import_roadrunner()
+        start = time.perf_counter()
+        state_path = self._cache_stem() + ".rrstate" if self.use_cache else None
+
+        if state_path and os.path.exists(state_path):
+            try:
+                rr = roadrunner.RoadRunner()
+                rr.loadState(state_path)
+                self.loaded_from_cache = True
+                self.load_seconds = time.perf_counter() - start
+                return rr
+            except Exception:
+                # Stale or incompatible cache: fall back to compiling the SBML
+                pass
+
+        rr = roadrunner.RoadRunner(self.model_path)
+        if state_path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{state_path}.{os.getpid()}.tmp"
+            rr.saveState(tmp_path)
+            os.replace(tmp_path, state_path)
+        self.load_seconds = time.perf_counter() - start
+        return rr
+
+    @property
+    def kinetic_params(self) -> List[str]:
+        return self.metadata['kinetic_params']
+
+    @property
+    def default_values(self) -> Dict[str, float]:
+        return self.metadata['default_values']
+
+    # --- sampling ---
+
+    def set_genotype(self, factors: Optional[Sequence[float]] = None):
+        """Reset to defaults and scale kinetic parameters by factors (None = wildtype)"""
+        rr = self.rr
+        for pid, default_val in self.default_values.items():
+            try:
+                rr.setValue(pid, default_val)
+            except RuntimeError:
+                continue
+        rr.resetAll()
+        if factors is None:
+            return
+        for pid, factor in zip(self.kinetic_params, factors):
+            try:
+                rr.setValue(pid, self.default_values[pid] * factor)
+            except RuntimeError:
+                continue
+
+    def sample_factors(self, rng=random) -> List[float]:
+        """Uniform random multiplier for every kinetic parameter"""
+        return [rng.choice(multipliers) for _ in self.kinetic_params]
+
+    def simulate(self, factors: Optional[Sequence[float]] = None,
+                 species: Sequence[str] = READOUT_SPECIES,
+                 tmax: float = SIMULATION_TIME, npoints: int = SIMULATION_POINTS):
+        """Integrate one genotype; returns (time, Y) or (None, None) on integrator failure"""
+        self.set_genotype(factors)
+        rr = self.rr
+        rr.selections = ["time"] + list(species)
+        try:
+            result = np.asarray(rr.simulate(0, tmax, npoints))
+        except RuntimeError:
+            return None, None
+        return result[:, 0], result[:, 1:]
+
+    def phenotype(self, factors: Optional[Sequence[float]] = None,
+                  species: Sequence[str] = READOUT_SPECIES, instr=None):
+        """
+        Simulate and extract phenotypes for the given species
+
+        Returns:
+            (status, time, Y, phenotypes) where status is 'integrator_failure' or the
+            status of the first species ('valid', 'divergent', 'no_oscillation', 'longperiod');
+            phenotypes holds every species and is None on integrator failure
+        """
+        if instr is not None:
+            with instr.stage('integrate'):
+                time_, Y = self.simulate(factors, species)
+        else:
+            time_, Y = self.simulate(factors, species)
+        if time_ is None:
+            return 'integrator_failure', None, None, None
+
+        phenotypes = encode_species_matrix(time_, Y, species, max_period=MAX_PERIOD_THRESHOLD,
+                                           diverge_threshold=DIVERGENCE_THRESHOLD, instr=instr)
+        return STATUS_NAMES[int(phenotypes.status[0])], time_, Y, phenotypes
+
+    def evaluate(self, factors: Sequence[float]):
+        """Evaluator for RarePhenotypeSampler / ConvergenceSampling (first readout species)"""
+        status, _, _, phenotypes = self.phenotype(factors)
+        if status != 'valid':
+            return None
+        result = phenotypes.get(phenotypes.species[0])
+        return result['encoding'], result['complexity'], result['period'], result['coarse_data']
+
+# === WORKERS ===
+_worker_model: Optional[ChenModel] = None
+_worker_instr = None
+
+def init_worker(model_path: Optional[str] = None, cache_dir: Optional[str] = CACHE_DIR):
+    """Pool initializer: restore the compiled model from the cache once per process"""
+    global _worker_model, _worker_instr
+    from SamplerInstrumentation import SamplerInstrumentation
+
+    _worker_model = ChenModel(model_path, cache_dir)
+    _worker_model.rr
+    _worker_instr = SamplerInstrumentation()
+
+def sample_batch(args):
+    """
+    Worker function: (batch_size, seed[, archive_dir[, species]]) -> phenotypes of every
+    readout species (READOUT_SPECIES unless given)
+
+    Returns one MultiSpeciesPhenotypes (complexities computed, coarse data dropped) per
+    integrated sample plus the number of integrator failures.
+
+    With archive_dir set, every integrated trajectory (valid or not) is appended to the
+    archive part archive_dir/part_<seed> for later re-analysis with TrajectoryArchive.
+    """
+    global _worker_model, _worker_instr
+    batch_size, seed = args[:2]
+    archive_dir = args[2] if len(args) > 2 else None
+    species = list(args[3]) if len(args) > 3 and args[3] else list(READOUT_SPECIES)
+    from SamplerInstrumentation import SamplerInstrumentation
+
+    if _worker_model is None:
+        _worker_model = ChenModel()
+    if _worker_instr is None:
+        _worker_instr = SamplerInstrumentation()
+    model = _worker_model
+    # One instrumentation per process: batch snapshots are cumulative for this worker
+    instr = _worker_instr
+    rng = random.Random(seed)
+    results = {'species': species, 'phenotypes': [], 'integrator_failures': 0,
+               'instrumentation': None}
+    archive = None
+
+    for _ in range(batch_size):
+        factors = model.sample_factors(rng)
+        status, time_, Y, phenotypes = model.phenotype(factors, species, instr=instr)
+        if archive_dir is not None and time_ is not None:
+            with instr.stage('archive'):
+                if archive is None:
+                    from TrajectoryArchive import TrajectoryArchiveWriter
+                    archive = TrajectoryArchiveWriter(os.path.join(archive_dir, f"part_{seed}"), time_,
+                                                      phenotypes.species, storage=ARCHIVE_STORAGE,
+                                                      downsample=ARCHIVE_DOWNSAMPLE, multipliers=multipliers,
+                                                      max_period=MAX_PERIOD_THRESHOLD,
+                                                      diverge_threshold=DIVERGENCE_THRESHOLD)
+                archive.append(Y, [multipliers.index(f) for f in factors], phenotypes)
+        if phenotypes is None:
+            results['integrator_failures'] += 1
+            instr.count(status)
+        else:
+            with instr.stage('CLZ'):
+                phenotypes.complexities
+            for code in phenotypes.status[phenotypes.status != VALID]:
+                instr.count(STATUS_NAMES[int(code)])
+            # The statistics only need encodings and complexities; keeps results small
+            phenotypes.coarse_time = phenotypes.coarse_signal = None
+            results['phenotypes'].append(phenotypes)
+        instr.sample_done()
+
+    if archive is not None:
+        archive.close()
+    results['instrumentation'] = instr.snapshot()
+    return results
+
+def run_sampling(n_samples: int, n_workers: int = 1, batch_size: int = 1000,
+                 seed: Optional[int] = None, model: Optional[ChenModel] = None, verbose: bool = True,
+                 archive_dir: Optional[str] = None, species: Optional[Sequence[str]] = None):
+    """
+    Headless uniform sampling with live statistics for every readout species
+
+    archive_dir: Optionally archive all integrated trajectories (see TrajectoryArchive);
+                 each run writes its parts to a new run_<timestamp>_<pid>_seed<seed> subdirectory
+    species: Readout species, all integrated and encoded together (default READOUT_SPECIES)
+
+    Returns:
+        (store, instrumentation_snapshot) where store is a MultiSpeciesPhenotypeStore
+        with one LiveSamplingStatistics per readout species in store.stats
+    """
+    global _worker_model, _worker_instr
+    from SamplerInstrumentation import SamplerInstrumentation, merge_instrumentation_snapshots
+
+    model = model or ChenModel()
+    # Make sure the cache exists before workers start
+    model.metadata
+    model.rr
+
+    species = list(species or READOUT_SPECIES)
+    store = MultiSpeciesPhenotypeStore(species, tracker_factory=None)
+    _, _, _, wt_phenotypes = model.phenotype(None, species)
+    if wt_phenotypes is not None:
+        for name, encoding in zip(wt_phenotypes.species, wt_phenotypes.encodings):
+            store.stats[name].set_reference('wildtype', encoding)
+
+    base_seed = seed if seed is not None else random.randrange(1 << 30)
+    if archive_dir is not None:
+        from TrajectoryArchive import new_run_directory
+        archive_dir = new_run_directory(archive_dir, base_seed)
+        if verbose:
+            print(f"Archiving trajectories in {archive_dir}")
+    batches = []
+    remaining = n_samples
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        batches.append((size, base_seed + len(batches), archive_dir, species))
+        remaining -= size
+
+    # Tracker updates run in this process, so they get their own instrumentation
+    main_instr = SamplerInstrumentation(worker_id="main")
+
+    def consume(batch_results, done):
+        for phenotypes in batch_results['phenotypes']:
+            with main_instr.stage('tracker_update'):
+                store.update(phenotypes)
+        for _ in range(batch_results['integrator_failures']):
+            store.update(None)
+        snapshots.append(batch_results['instrumentation'])
+        if verbose:
+            print(f"{done:,}/{n_samples:,} | integrator failures: {store.integration_failures:,}")
+            for name, stats in store.stats.items():
+                print(f"   {name:<8} success: {stats.ranks.total_samples:,} | "
+                      f"skip: {sum(stats.failures.values()):,} | {stats.format_progress()}")
+
+    snapshots = []
+    done = 0
+    start_time = time.perf_counter()
+    if n_workers > 1:
+        from multiprocessing import Pool
+        with Pool(n_workers, initializer=init_worker,
+                  initargs=(model.model_path, model.cache_dir if model.use_cache else None)) as pool:
+            for batch_results in pool.imap_unordered(sample_batch, batches):
+                done += len(batch_results['phenotypes']) + batch_results['integrator_failures']
+                consume(batch_results, done)
+    else:
+        _worker_model = model
+        _worker_instr = SamplerInstrumentation()
+        for batch in batches:
+            batch_results = sample_batch(batch)
+            done += batch[0]
+            consume(batch_results, done)
+
+    snapshots.append(main_instr.snapshot())
+    return store, merge_instrumentation_snapshots(snapshots, time.perf_counter() - start_time)
+
+def main():
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description="Headless Chen 2004 phenotype sampling")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default=None, help="Pickle the final statistics snapshot here")
+    parser.add_argument("--plots", action="store_true", help="Save plots to plots/ (imports matplotlib)")
+    parser.add_argument("--species", nargs="+", default=READOUT_SPECIES,
+                        help="Readout species, encoded together from one integration")
+    parser.add_argument("--archive", default=None,
+                        help="Archive trajectories here for re-analysis (python TrajectoryArchive.py <dir>)")
+    args = parser.parse_args()
+
+    model = ChenModel(args.model_path, args.cache_dir, use_cache=not args.no_cache)
+    store, timings = run_sampling(args.samples, args.workers, args.batch_size, args.seed, model,
+                                  archive_dir=args.archive, species=args.species)
+
+    from SamplerInstrumentation import print_instrumentation_report
+    print_instrumentation_report(timings)
+    results = {'readout_species': list(store.species), 'species': {},
+               'settings': {'max_period': MAX_PERIOD_THRESHOLD, 'diverge_threshold': DIVERGENCE_THRESHOLD}}
+    for species, stats in store.stats.items():
+        snapshot = stats.snapshot()
+        print(f"\n{species} mean complexity: {snapshot['complexity_mean']:.3f} ± {snapshot['complexity_std']:.3f}")
+        print(f"{species} wildtype: {snapshot['reference_ranks'].get('wildtype')}")
+        encoding_wt = stats.reference_encodings.get('wildtype')
+        if encoding_wt is not None and snapshot['reference_ranks']['wildtype'] is None and stats.ranks.frequencies:
+            from PhenotypeIndex import PhenotypeHammingIndex, neighbourhood_report
+            index = PhenotypeHammingIndex.from_counter(stats.ranks.frequencies)
+            neighbourhood_report(index, encoding_wt, label=f"{species} wildtype")
+        results['species'][species] = {'snapshot': snapshot, 'frequencies': stats.ranks.frequencies}
+        if args.plots:
+            import ChenPlots
+            ChenPlots.plot_statistics_snapshot(snapshot, stats.ranks.frequencies,
+                                               stats.reference_encodings.get('wildtype'),
+                                               prefix=f"Chen_{species}", show=False)
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            pickle.dump(results, f)
+
+if __name__ == "__main__":
+    main()
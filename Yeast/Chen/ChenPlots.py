@@ -0,0 +1,94 @@
+"""
+Plotting for the Chen Sampling Pipeline
+Kept separate from ChenPipeline so headless batch runs never import matplotlib
+"""
+
+import os
+from collections import Counter
+from typing import Dict, Optional
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from VectorizedPhenotypes import CLZ
+
+def _finish(savepath: Optional[str], show: bool):
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    if savepath:
+        os.makedirs(os.path.dirname(savepath) or ".", exist_ok=True)
+        plt.savefig(savepath, dpi=300, bbox_inches='tight')
+    if show:
+        plt.show()
+    else:
+        plt.close()
+
+def plot_trajectory(time, signal, label="CLB2", title="Chen model (CLB2 trajectory)",
+                    savepath: Optional[str] = None, show: bool = True):
+    plt.figure()
+    plt.plot(time, signal, label=label)
+    plt.xlabel("Time (min)")
+    plt.ylabel("Concentration")
+    plt.title(title)
+    plt.legend()
+    _finish(savepath, show)
+
+def plot_complexity_distribution(complexities, bins=50, title_suffix="",
+                                 savepath: Optional[str] = None, show: bool = True):
+    plt.figure(figsize=(10, 6))
+    plt.hist(complexities, bins=bins, color='skyblue', edgecolor='black', alpha=0.7)
+    plt.xlabel("Lempel-Ziv Complexity (CLZ)")
+    plt.ylabel("Count")
+    plt.title(f"Distribution of CLZ Complexity (CLB2 up-down encoding){title_suffix}")
+    _finish(savepath, show)
+
+def plot_binned_complexity_distribution(edges, counts, title_suffix="",
+                                        savepath: Optional[str] = None, show: bool = True):
+    """Same as plot_complexity_distribution for pre-binned (live statistics) counts"""
+    plt.figure(figsize=(10, 6))
+    plt.stairs(counts, edges, fill=True, color='skyblue', edgecolor='black', alpha=0.7)
+    plt.xlabel("Lempel-Ziv Complexity (CLZ)")
+    plt.ylabel("Count")
+    plt.title(f"Distribution of CLZ Complexity (CLB2 up-down encoding){title_suffix}")
+    _finish(savepath, show)
+
+def plot_rank_frequency(phenotype_counts: Counter, title_suffix="",
+                        savepath: Optional[str] = None, show: bool = True):
+    frequencies = sorted(phenotype_counts.values(), reverse=True)
+    ranks = np.arange(1, len(frequencies) + 1)
+    plt.figure(figsize=(10, 6))
+    plt.loglog(ranks, frequencies, marker='o', linestyle='none', markersize=3)
+    plt.xlabel("Rank")
+    plt.ylabel("Frequency")
+    plt.title(f"Log-Log Plot of Phenotype String Frequency by Rank{title_suffix}")
+    _finish(savepath, show)
+
+def plot_frequency_vs_complexity(phenotype_counts: Counter, encoding_wt: Optional[str] = None,
+                                 title_suffix="", savepath: Optional[str] = None, show: bool = True):
+    phenotype_complexities = [CLZ(p) for p in phenotype_counts]
+    phenotype_frequencies = list(phenotype_counts.values())
+
+    plt.figure(figsize=(10, 6))
+    plt.scatter(phenotype_complexities, phenotype_frequencies, alpha=0.6, s=20, label='Random phenotypes')
+    if encoding_wt in phenotype_counts:
+        plt.scatter(CLZ(encoding_wt), phenotype_counts[encoding_wt], marker='*', s=200, color='red',
+                    edgecolor='black', linewidth=1, label='Wildtype', zorder=5)
+    plt.xlabel("Phenotype Complexity (CLZ)")
+    plt.ylabel("Phenotype Frequency")
+    plt.title(f"Phenotype Frequency vs Complexity{title_suffix}")
+    plt.legend()
+    _finish(savepath, show)
+
+def plot_statistics_snapshot(snapshot: Dict, phenotype_counts: Counter, encoding_wt: Optional[str] = None,
+                             plot_dir: str = "plots", prefix: str = "Chen", show: bool = True):
+    """Standard three plots from a LiveSamplingStatistics snapshot"""
+    n = snapshot['successful_samples']
+    suffix = f"\nChen Model, N={n:,} samples ({snapshot['elapsed_s']/60:.1f}min)"
+    plot_binned_complexity_distribution(
+        snapshot['histogram_edges'], snapshot['histogram_counts'], suffix,
+        os.path.join(plot_dir, f"{prefix}_complexity_distribution_N{n}.png"), show)
+    plot_rank_frequency(phenotype_counts, suffix,
+                        os.path.join(plot_dir, f"{prefix}_rank_frequency_loglog_N{n}.png"), show)
+    plot_frequency_vs_complexity(phenotype_counts, encoding_wt, suffix,
+                                 os.path.join(plot_dir, f"{prefix}_frequency_vs_complexity_N{n}.png"), show)
+    print(f"\nPlots saved to '{plot_dir}/' directory")
@@ -0,0 +1,200 @@
+"""
+Convergence-Driven Genotype Sampling
+Stratified / low-discrepancy draws over the multiplier lattice with bootstrap
+diagnostics that stop the run once the frequency-complexity picture is stable
+"""
+
+import numpy as np
+import time
+from typing import Dict, List, Optional, Sequence
+
+from PhenotypeStatistics import LiveSamplingStatistics
+from RarePhenotypeSampler import MULTIPLIERS, Evaluator
+
+try:
+    from scipy.stats import qmc
+    scipy_qmc_available = True
+except ImportError:
+    scipy_qmc_available = False
+
+class StratifiedLatticeSampler:
+    """Genotype draws over the multiplier lattice with balanced parameter marginals
+
+    'latin': within every block of len(multipliers) draws each parameter takes each
+             multiplier exactly once (independent permutation per parameter)
+    'sobol': scrambled Sobol points mapped onto the lattice (requires scipy)
+    'random': plain independent random.choice-style draws, for comparison
+    """
+
+    def __init__(self, n_params: int, multipliers: Sequence[float] = MULTIPLIERS,
+                 method: str = "latin", seed: Optional[int] = None):
+        self.n_params = n_params
+        self.multipliers = np.asarray(multipliers, dtype=float)
+        self.n_levels = len(self.multipliers)
+        self.method = method
+        self.rng = np.random.default_rng(seed)
+        self._block: List[np.ndarray] = []
+        self.n_drawn = 0
+
+        if method == "sobol":
+            if not scipy_qmc_available:
+                raise ImportError("method='sobol' requires scipy.stats.qmc")
+            self._sobol = qmc.Sobol(d=n_params, scramble=True, seed=seed)
+        elif method not in ("latin", "random"):
+            raise ValueError(f"Unknown sampling method: {method}")
+
+    def _next_block(self) -> List[np.ndarray]:
+        if self.method == "latin":
+            levels = np.array([self.rng.permutation(self.n_levels) for _ in range(self.n_params)])
+            return list(levels.T)
+        if self.method == "sobol":
+            # Powers of two keep the Sobol balance properties
+            u = self._sobol.random(64)
+            return list(np.minimum((u * self.n_levels).astype(int), self.n_levels - 1))
+        return [self.rng.integers(self.n_levels, size=self.n_params)]
+
+    def draw_indices(self) -> np.ndarray:
+        """Next genotype as indices into multipliers"""
+        if not self._block:
+            self._block = self._next_block()
+        self.n_drawn += 1
+        return self._block.pop()
+
+    def draw(self) -> np.ndarray:
+        """Next genotype as multiplier factors, in kinetic parameter order"""
+        return self.multipliers[self.draw_indices()]
+
+class ConvergenceMonitor:
+    """Bootstrap error on complexity-bin frequencies and rank-curve slope
+
+    The run is converged when, for `patience` consecutive checks, every complexity-bin
+    frequency has bootstrap standard error <= precision and the log-log rank/frequency
+    slope has standard error <= slope_tolerance.
+    """
+
+    def __init__(self, precision: float = 0.002, slope_tolerance: float = 0.01,
+                 n_bootstrap: int = 100, min_count_for_slope: int = 5,
+                 patience: int = 3, seed: Optional[int] = None):
+        self.precision = precision
+        self.slope_tolerance = slope_tolerance
+        self.n_bootstrap = n_bootstrap
+        self.min_count_for_slope = min_count_for_slope
+        self.patience = patience
+        self.rng = np.random.default_rng(seed)
+        self.history: List[Dict] = []
+        self._consecutive = 0
+
+    def _bin_frequency_error(self, counts: np.ndarray) -> float:
+        """Largest bootstrap standard error over complexity-bin frequencies"""
+        n = counts.sum()
+        if n == 0:
+            return np.inf
+        replicates = self.rng.multinomial(n, counts / n, size=self.n_bootstrap) / n
+        return float(replicates.std(axis=0).max())
+
+    @staticmethod
+    def _slope(frequencies: np.ndarray, min_count: int) -> float:
+        frequencies = np.sort(frequencies[frequencies >= min_count])[::-1]
+        if len(frequencies) < 3:
+            return np.nan
+        ranks = np.arange(1, len(frequencies) + 1)
+        return float(np.polyfit(np.log(ranks), np.log(frequencies), 1)[0])
+
+    def _slope_error(self, frequencies: np.ndarray) -> float:
+        """Poisson-bootstrap standard error of the rank/frequency slope"""
+        replicates = []
+        for _ in range(self.n_bootstrap):
+            resampled = self.rng.poisson(frequencies)
+            replicates.append(self._slope(resampled, self.min_count_for_slope))
+        replicates = np.array(replicates)
+        replicates = replicates[np.isfinite(replicates)]
+        return float(replicates.std()) if len(replicates) > 1 else np.inf
+
+    def check(self, stats: LiveSamplingStatistics) -> Dict:
+        """Compute diagnostics on the current statistics and update the stopping state"""
+        hist = stats.complexity_histogram
+        counts = np.concatenate(([hist.underflow], hist.counts, [hist.overflow]))
+        frequencies = np.fromiter(stats.ranks.frequencies.values(), dtype=np.int64)
+
+        diagnostics = {
+            'samples': stats.ranks.total_samples,
+            'n_phenotypes': stats.ranks.n_phenotypes,
+            'max_bin_error': self._bin_frequency_error(counts),
+            'slope': self._slope(frequencies, self.min_count_for_slope),
+        }
+        # Too few phenotypes above min_count to fit a slope yet
+        diagnostics['slope_error'] = (self._slope_error(frequencies)
+                                      if np.isfinite(diagnostics['slope']) else np.inf)
+        passed = (diagnostics['max_bin_error'] <= self.precision and
+                  diagnostics['slope_error'] <= self.slope_tolerance)
+        self._consecutive = self._consecutive + 1 if passed else 0
+        diagnostics['converged'] = self._consecutive >= self.patience
+        self.history.append(diagnostics)
+        return diagnostics
+
+    @property
+    def converged(self) -> bool:
+        return bool(self.history) and self.history[-1]['converged']
+
+def run_until_converged(evaluate: Evaluator, n_params: int,
+                        sampler: Optional[StratifiedLatticeSampler] = None,
+                        monitor: Optional[ConvergenceMonitor] = None,
+                        stats: Optional[LiveSamplingStatistics] = None,
+                        tracker=None, min_samples: int = 5000, max_samples: int = 1000000,
+                        check_interval: int = 5000, verbose: bool = True):
+    """
+    Sample until the convergence monitor is satisfied (or max_samples is reached)
+
+    Args:
+        evaluate: Evaluator as in RarePhenotypeSampler (e.g. make_roadrunner_evaluator)
+        min_samples: Successful samples required before stopping is allowed
+        check_interval: Draws between convergence checks
+
+    Returns:
+        (stats, monitor)
+    """
+    sampler = sampler or StratifiedLatticeSampler(n_params)
+    monitor = monitor or ConvergenceMonitor()
+    stats = stats or LiveSamplingStatistics()
+    start_time = time.time()
+
+    if verbose:
+        print(f"Convergence-driven sampling ({sampler.method} draws): "
+              f"bin precision {monitor.precision}, slope tolerance {monitor.slope_tolerance}, "
+              f"max {max_samples:,} draws")
+
+    for i in range(max_samples):
+        factors = sampler.draw()
+        result = evaluate(factors)
+        if result is None:
+            stats.record_failure('rejected')
+        else:
+            encoding, complexity = result[0], result[1]
+            stats.update(encoding, complexity)
+            if tracker is not None and len(result) >= 4:
+                tracker.update(encoding, complexity, result[2], genotype=factors.tolist(),
+                               coarse_data=result[3])
+
+        if (i + 1) % check_interval == 0 and stats.ranks.total_samples > 0:
+            diagnostics = monitor.check(stats)
+            if verbose:
+                elapsed = time.time() - start_time
+                print(f"{i+1:,} draws | success: {diagnostics['samples']:,} | "
+                      f"phenotypes: {diagnostics['n_phenotypes']:,} | "
+                      f"bin SE: {diagnostics['max_bin_error']:.4f} | "
+                      f"slope: {diagnostics['slope']:.3f}±{diagnostics['slope_error']:.3f} | "
+                      f"rate: {(i+1)/elapsed:.1f}/s")
+            if diagnostics['converged'] and diagnostics['samples'] >= min_samples:
+                if verbose:
+                    print(f"✓ Converged after {i+1:,} draws")
+                break
+    else:
+        if verbose:
+            print(f"⚠️  Reached max_samples={max_samples:,} before convergence")
+
+    return stats, monitor
+
+if __name__ == "__main__":
+    # Example usage
+    print("run_until_converged - stratified lattice sampling with automatic stopping")
+    print("stats, monitor = run_until_converged(evaluate, len(kinetic_params), tracker=tracker)")
@@ -0,0 +1,319 @@
+"""
+Hamming-Neighbourhood Index over Observed Phenotypes
+Answers "all observed phenotypes within Hamming distance d of X" and
+"k nearest phenotypes with their frequencies" using multi-index hashing
+over packed up-down encodings
+"""
+
+import numpy as np
+import math
+from collections import Counter
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def pack_encoding(encoding: str) -> int:
+    """Pack a binary up-down string ('0101...') into a Python int"""
+    return int(encoding, 2)
+
+def unpack_encoding(code: int, n_bits: int) -> str:
+    """Inverse of pack_encoding for a fixed encoding length"""
+    return format(code, f'0{n_bits}b')
+
+def hamming_distance(a: str, b: str) -> int:
+    """Hamming distance between two equal-length binary strings"""
+    if len(a) != len(b):
+        raise ValueError(f"Encodings differ in length: {len(a)} vs {len(b)}")
+    return (pack_encoding(a) ^ pack_encoding(b)).bit_count()
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """Vectorised popcount for uint64 arrays (uses np.bitwise_count when available)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+    return table[values.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+class PhenotypeHammingIndex:
+    """Multi-index hash over packed phenotype encodings with frequencies
+
+    The n_bits of an encoding are split into n_tables disjoint chunks, each with its own
+    hash table. If two encodings are within Hamming distance d, at least one chunk differs
+    by at most d // n_tables bits (pigeonhole), so only a handful of buckets are probed
+    before the exact distance is verified on the candidates.
+    """
+
+    # Approximate cost of one Python bucket probe / candidate lookup in numpy-scan elements
+    PROBE_COST = 256
+    CANDIDATE_COST = 64
+
+    def __init__(self, n_bits: int, n_tables: Optional[int] = None):
+        """
+        Args:
+            n_bits: Encoding length, e.g. 49 for the paper method (50 coarse-grained steps)
+                    or 40 for HeavySample_SloppyCell's up_down_encoding
+        """
+        if n_bits > 64:
+            raise ValueError("Encodings longer than 64 bits are not supported")
+        self.n_bits = n_bits
+        if n_tables is None:
+            # ~16-bit chunks keep buckets small for millions of distinct phenotypes
+            n_tables = max(1, round(n_bits / 16))
+        self.n_tables = n_tables
+
+        # Chunk layout: (shift, width) from the least significant bit upward
+        base, extra = divmod(n_bits, n_tables)
+        self._chunks = []
+        shift = 0
+        for j in range(n_tables):
+            width = base + (1 if j < extra else 0)
+            self._chunks.append((shift, width))
+            shift += width
+
+        self.codes: List[int] = []
+        self.counts: List[int] = []
+        self._id_of: Dict[int, int] = {}
+        self.tables: List[Dict[int, List[int]]] = [dict() for _ in range(n_tables)]
+        self.total_count = 0
+
+        # Dense copies of codes / counts for linear-scan fallback, rebuilt lazily
+        self._dense_codes = None
+        self._dense_counts = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, encoding: str):
+        return pack_encoding(encoding) in self._id_of
+
+    def _chunk(self, code: int, j: int) -> int:
+        shift, width = self._chunks[j]
+        return (code >> shift) & ((1 << width) - 1)
+
+    def _check_length(self, encoding: str):
+        if len(encoding) != self.n_bits:
+            raise ValueError(f"Expected {self.n_bits}-bit encoding, got {len(encoding)} bits")
+
+    def add(self, encoding: str, count: int = 1):
+        """Add count observations of a phenotype (O(n_tables) for a new phenotype)"""
+        self._check_length(encoding)
+        code = pack_encoding(encoding)
+        self.total_count += count
+
+        idx = self._id_of.get(code)
+        if idx is not None:
+            self.counts[idx] += count
+            self._dense_counts = None
+            return
+
+        idx = len(self.codes)
+        self._id_of[code] = idx
+        self.codes.append(code)
+        self.counts.append(count)
+        for j, table in enumerate(self.tables):
+            table.setdefault(self._chunk(code, j), []).append(idx)
+        self._dense_codes = None
+        self._dense_counts = None
+
+    def update(self, encodings: Iterable[str]):
+        """Add one observation per encoding"""
+        for encoding in encodings:
+            self.add(encoding)
+
+    @classmethod
+    def from_counter(cls, phenotype_counts: Counter, n_tables: Optional[int] = None):
+        """Build an index from a phenotype Counter (e.g. tracker.frequencies)"""
+        if not phenotype_counts:
+            raise ValueError("Cannot infer encoding length from an empty Counter")
+        n_bits = len(next(iter(phenotype_counts)))
+        index = cls(n_bits=n_bits, n_tables=n_tables)
+        for encoding, count in phenotype_counts.items():
+            index.add(encoding, count)
+        return index
+
+    def frequency(self, encoding: str) -> int:
+        """Observed count of an exact phenotype (0 if never seen)"""
+        idx = self._id_of.get(pack_encoding(encoding))
+        return 0 if idx is None else self.counts[idx]
+
+    def _probe_size(self, radius: int) -> int:
+        """Number of bucket probes needed for a chunk radius"""
+        return sum(
+            sum(math.comb(width, r) for r in range(min(radius, width) + 1))
+            for _, width in self._chunks
+        )
+
+    def _candidates(self, code: int, d: int) -> Optional[set]:
+        """Candidate ids whose encoding may be within distance d of code"""
+        radius = d // self.n_tables
+        if self._probe_size(radius) >= len(self.codes):
+            # Probing would touch more buckets than there are phenotypes
+            return None
+        return self._probe(code, radius)
+
+    def _probe(self, code: int, radius: int) -> set:
+        """Ids in every bucket within chunk distance radius of code"""
+        candidates = set()
+        for j, table in enumerate(self.tables):
+            _, width = self._chunks[j]
+            key = self._chunk(code, j)
+            for r in range(min(radius, width) + 1):
+                for bits in combinations(range(width), r):
+                    probe = key
+                    for b in bits:
+                        probe ^= 1 << b
+                    bucket = table.get(probe)
+                    if bucket:
+                        candidates.update(bucket)
+        return candidates
+
+    def _dense_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """numpy copies of codes and counts, rebuilt after additions"""
+        if self._dense_codes is None:
+            self._dense_codes = np.array(self.codes, dtype=np.uint64)
+        if self._dense_counts is None:
+            self._dense_counts = np.array(self.counts, dtype=np.int64)
+        return self._dense_codes, self._dense_counts
+
+    def _linear_scan(self, code: int, d: int) -> List[Tuple[int, int]]:
+        """Vectorised exact scan over all phenotypes"""
+        distances = _popcount64(self._dense_arrays()[0] ^ np.uint64(code))
+        hits = np.nonzero(distances <= d)[0]
+        return [(int(i), int(distances[i])) for i in hits]
+
+    def _select_nearest(self, ids: np.ndarray, distances: np.ndarray, k: int,
+                        include_self: bool) -> List[Tuple[str, int, int]]:
+        """k best of (ids, distances) by distance, then frequency, via argpartition"""
+        if not include_self:
+            keep = distances > 0
+            ids, distances = ids[keep], distances[keep]
+        # Distance of the k-th nearest; only phenotypes up to it need ranking
+        cutoff = np.searchsorted(np.cumsum(np.bincount(distances, minlength=self.n_bits + 1)), k)
+        shortlist = np.flatnonzero(distances <= cutoff)
+        ids, distances = ids[shortlist], distances[shortlist]
+
+        counts = self._dense_arrays()[1][ids]
+        max_count = int(counts.max())
+        order_key = distances * (max_count + 1) + (max_count - counts)
+        top = np.argpartition(order_key, k - 1)[:k] if k < len(order_key) else np.arange(len(order_key))
+        top = top[np.argsort(order_key[top], kind='stable')]
+        return [(unpack_encoding(self.codes[ids[i]], self.n_bits), int(distances[i]), int(counts[i]))
+                for i in top]
+
+    def within(self, encoding: str, d: int) -> List[Tuple[str, int, int]]:
+        """
+        All observed phenotypes within Hamming distance d of encoding
+
+        Returns:
+            List of (encoding, distance, frequency), nearest first and most frequent
+            first within equal distance
+        """
+        self._check_length(encoding)
+        code = pack_encoding(encoding)
+
+        candidates = self._candidates(code, d)
+        if candidates is None:
+            hits = self._linear_scan(code, d)
+        else:
+            hits = []
+            for idx in candidates:
+                dist = (self.codes[idx] ^ code).bit_count()
+                if dist <= d:
+                    hits.append((idx, dist))
+
+        hits.sort(key=lambda x: (x[1], -self.counts[x[0]]))
+        return [(unpack_encoding(self.codes[idx], self.n_bits), dist, self.counts[idx])
+                for idx, dist in hits]
+
+    def nearest(self, encoding: str, k: int = 9,
+                include_self: bool = True) -> List[Tuple[str, int, int]]:
+        """
+        k nearest observed phenotypes with their frequencies
+
+        Grows the chunk radius until at least k phenotypes are found; ties at the
+        cut-off distance are broken by frequency (highest first). Once probing would cost
+        more than a scan, all distances are computed once and the k nearest selected
+        with np.argpartition.
+
+        Args:
+            include_self: Whether an exact match counts as one of the k neighbours
+        """
+        self._check_length(encoding)
+        available = len(self.codes) - (0 if include_self or encoding not in self else 1)
+        k = min(k, available)
+        if k <= 0:
+            return []
+
+        code = pack_encoding(encoding)
+        n = len(self.codes)
+        for radius in range(self.n_bits + 1):
+            # Python probing + candidate lookups vs. one vectorised pass over all phenotypes
+            expected_candidates = sum(
+                sum(math.comb(width, r) for r in range(min(radius, width) + 1)) * n / 2 ** width
+                for _, width in self._chunks
+            )
+            if self._probe_size(radius) * self.PROBE_COST + expected_candidates * self.CANDIDATE_COST >= n:
+                distances = _popcount64(self._dense_arrays()[0] ^ np.uint64(code))
+                return self._select_nearest(np.arange(n), distances, k, include_self)
+
+            # Chunk radius r finds everything within (r + 1) * n_tables - 1 (pigeonhole)
+            complete_to = (radius + 1) * self.n_tables - 1
+            ids = np.fromiter(self._probe(code, radius), dtype=np.int64)
+            distances = _popcount64(self._dense_arrays()[0][ids] ^ np.uint64(code))
+            keep = (distances <= complete_to) & (include_self | (distances > 0))
+            if keep.sum() >= k:
+                return self._select_nearest(ids[keep], distances[keep], k, include_self)
+        return []
+
+    def neighbourhood_summary(self, encoding: str, d: int = 1) -> Dict[str, float]:
+        """
+        Frequency of the phenotype and of its observed Hamming neighbourhood
+
+        'local_robustness' is the share of observations in the radius-d ball that fall
+        on the phenotype itself: a phenotype-space proxy for how often small changes in
+        parameters keep the exact same phenotype rather than a nearby one.
+        """
+        hits = self.within(encoding, d)
+        own = self.frequency(encoding)
+        neighbour_hits = [h for h in hits if h[1] > 0]
+        neighbour_frequency = sum(freq for _, _, freq in neighbour_hits)
+        possible = sum(math.comb(self.n_bits, r) for r in range(1, d + 1))
+        ball_frequency = own + neighbour_frequency
+
+        by_distance = Counter()
+        for _, dist, freq in neighbour_hits:
+            by_distance[dist] += freq
+
+        return {
+            'frequency': own,
+            'radius': d,
+            'observed_neighbours': len(neighbour_hits),
+            'possible_neighbours': possible,
+            'fraction_neighbours_observed': len(neighbour_hits) / possible if possible else 0.0,
+            'neighbour_frequency': neighbour_frequency,
+            'neighbour_frequency_by_distance': dict(sorted(by_distance.items())),
+            'ball_share_of_samples': ball_frequency / self.total_count if self.total_count else 0.0,
+            'local_robustness': own / ball_frequency if ball_frequency else 0.0,
+        }
+
+# Utility functions for analysis
+def neighbourhood_report(index: PhenotypeHammingIndex, encoding: str,
+                         max_distance: int = 3, k: int = 9, label: str = "Target"):
+    """Print the Hamming neighbourhood of a phenotype (e.g. wildtype or a troubleshooting target)"""
+    print(f"\n=== HAMMING NEIGHBOURHOOD: {label} ===")
+    print(f"Encoding: {encoding}")
+    print(f"Exact frequency: {index.frequency(encoding):,} / {index.total_count:,} samples")
+
+    for d in range(1, max_distance + 1):
+        summary = index.neighbourhood_summary(encoding, d)
+        print(f"  d<={d}: {summary['observed_neighbours']:,} neighbours observed "
+              f"({summary['fraction_neighbours_observed']*100:.2f}% of {summary['possible_neighbours']:,}), "
+              f"neighbour freq {summary['neighbour_frequency']:,}, "
+              f"local robustness {summary['local_robustness']:.3f}")
+
+    print(f"\n{k} nearest observed phenotypes:")
+    for i, (neighbour, dist, freq) in enumerate(index.nearest(encoding, k=k)):
+        print(f"{i+1:2d}. d={dist:2d} | Frequency: {freq:8,} | {neighbour}")
+
+if __name__ == "__main__":
+    # Example usage
+    print("PhenotypeHammingIndex - Hamming-neighbourhood queries over observed phenotypes")
+    print("Build with PhenotypeHammingIndex.from_counter(phenotype_counts) after sampling")
@@ -0,0 +1,308 @@
+"""
+Live Incremental Phenotype Statistics
+Rank/frequency, complexity moments and CLZ histogram that update in O(log n) per sample
+and can be queried or snapshotted at any point of a long sampling run
+"""
+
+import numpy as np
+import json
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+class FenwickTree:
+    """Growable binary indexed tree over positive integer keys (phenotype counts)"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        # Non-zero key -> value mapping, so growing never loses stored values
+        self.values: Dict[int, int] = {}
+
+    def _grow(self, key: int):
+        """Rebuild with at least key slots from the stored key -> value mapping"""
+        while self.capacity < key:
+            self.capacity *= 2
+        self.tree = [0] * (self.capacity + 1)
+        for k, v in self.values.items():
+            self._add(k, v)
+
+    def _add(self, key: int, delta: int):
+        while key <= self.capacity:
+            self.tree[key] += delta
+            key += key & -key
+
+    def add(self, key: int, delta: int):
+        """Add delta at key (keys start at 1), growing the tree when needed"""
+        if key < 1:
+            raise ValueError(f"Fenwick keys start at 1, got {key}")
+        value = self.values.get(key, 0) + delta
+        if value:
+            self.values[key] = value
+        else:
+            self.values.pop(key, None)
+        if key > self.capacity:
+            # The rebuild already includes this update
+            self._grow(key)
+            return
+        self._add(key, delta)
+
+    def prefix_sum(self, key: int) -> int:
+        """Sum of values for keys 1..key"""
+        key = min(key, self.capacity)
+        total = 0
+        while key > 0:
+            total += self.tree[key]
+            key -= key & -key
+        return total
+
+class StreamingMoments:
+    """Welford running mean/variance with min/max"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    @property
+    def variance(self) -> float:
+        """Population variance (matches np.var / np.std defaults)"""
+        return self._m2 / self.n if self.n else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def merge(self, other: "StreamingMoments"):
+        """Combine moments from another stream (e.g. a worker batch)"""
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+class FixedBinHistogram:
+    """Fixed-width histogram with underflow/overflow counters, O(1) per sample"""
+
+    def __init__(self, low: float = 0.0, high: float = 80.0, bin_size: float = 0.5):
+        self.low = low
+        self.high = high
+        self.bin_size = bin_size
+        self.n_bins = int(math.ceil((high - low) / bin_size))
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self.low + self.bin_size * np.arange(self.n_bins + 1)
+
+    def bin_index(self, x: float) -> int:
+        """Bin of x, -1 for underflow and n_bins for overflow"""
+        if x < self.low:
+            return -1
+        idx = int((x - self.low) / self.bin_size)
+        return idx if idx < self.n_bins else self.n_bins
+
+    def update(self, x: float):
+        idx = self.bin_index(x)
+        if idx < 0:
+            self.underflow += 1
+        elif idx >= self.n_bins:
+            self.overflow += 1
+        else:
+            self.counts[idx] += 1
+
+    def merge(self, other: "FixedBinHistogram"):
+        if (other.low, other.high, other.bin_size) != (self.low, self.high, self.bin_size):
+            raise ValueError("Cannot merge histograms with different binning")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+class RankFrequencyStatistics:
+    """Order statistics over phenotype counts
+
+    A Fenwick tree indexed by count holds how many phenotypes currently have each count,
+    so the rank of any phenotype is one prefix-sum query away.
+    """
+
+    def __init__(self):
+        self.frequencies = Counter()
+        self.count_of_counts: Dict[int, int] = Counter()
+        self._tree = FenwickTree()
+        self.total_samples = 0
+
+    def update(self, encoding: str):
+        """Record one observation of a phenotype in O(log n)"""
+        old = self.frequencies[encoding]
+        new = old + 1
+        self.frequencies[encoding] = new
+        self.total_samples += 1
+
+        if old:
+            self.count_of_counts[old] -= 1
+            if not self.count_of_counts[old]:
+                del self.count_of_counts[old]
+            self._tree.add(old, -1)
+        self.count_of_counts[new] += 1
+        self._tree.add(new, 1)
+
+    @property
+    def n_phenotypes(self) -> int:
+        return len(self.frequencies)
+
+    def _n_with_count_above(self, count: int) -> int:
+        return self.n_phenotypes - self._tree.prefix_sum(count)
+
+    def rank(self, encoding: str) -> Optional[int]:
+        """Rank of a phenotype by frequency (1 = most frequent, ties share the best rank)"""
+        count = self.frequencies.get(encoding, 0)
+        if count == 0:
+            return None
+        return self._n_with_count_above(count) + 1
+
+    def rank_range(self, encoding: str) -> Optional[Tuple[int, int]]:
+        """(best, worst) rank positions a phenotype can take among equally frequent ones"""
+        count = self.frequencies.get(encoding, 0)
+        if count == 0:
+            return None
+        best = self._n_with_count_above(count) + 1
+        return best, best + self.count_of_counts[count] - 1
+
+    def rank_frequency_curve(self, compressed: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Current rank/frequency curve, same as sorting the Counter
+
+        Args:
+            compressed: Return one point per distinct count (first rank with that count)
+                        instead of one point per phenotype
+        """
+        if not self.count_of_counts:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        counts = np.array(sorted(self.count_of_counts, reverse=True), dtype=np.int64)
+        multiplicity = np.array([self.count_of_counts[c] for c in counts], dtype=np.int64)
+        if compressed:
+            first_ranks = np.concatenate(([1], 1 + np.cumsum(multiplicity)[:-1]))
+            return first_ranks, counts
+        frequencies = np.repeat(counts, multiplicity)
+        return np.arange(1, len(frequencies) + 1), frequencies
+
+class LiveSamplingStatistics:
+    """Rank/frequency, complexity moments and CLZ histogram kept up to date during sampling"""
+
+    def __init__(self, hist_low: float = 0.0, hist_high: float = 80.0, bin_size: float = 0.5,
+                 reference_encodings: Optional[Dict[str, str]] = None):
+        self.ranks = RankFrequencyStatistics()
+        self.complexity_moments = StreamingMoments()
+        self.complexity_histogram = FixedBinHistogram(hist_low, hist_high, bin_size)
+        self.failures = Counter()
+        self.start_time = time.time()
+        # Named phenotypes to follow in progress lines, e.g. {'wildtype': encoding_wt}
+        self.reference_encodings = dict(reference_encodings or {})
+
+    def update(self, encoding: str, complexity: float):
+        """Record one successful sample"""
+        self.ranks.update(encoding)
+        self.complexity_moments.update(complexity)
+        self.complexity_histogram.update(complexity)
+
+    def record_failure(self, reason: str):
+        """Record a skipped sample ('divergent', 'no_oscillation', 'longperiod', ...)"""
+        self.failures[reason] += 1
+
+    def set_reference(self, name: str, encoding: Optional[str]):
+        """Follow the rank of a named phenotype (None removes it)"""
+        if encoding is None:
+            self.reference_encodings.pop(name, None)
+        else:
+            self.reference_encodings[name] = encoding
+
+    def reference_ranks(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        """Current (rank, frequency) of each reference phenotype, None if not yet seen"""
+        result = {}
+        for name, encoding in self.reference_encodings.items():
+            rank = self.ranks.rank(encoding)
+            result[name] = None if rank is None else (rank, self.ranks.frequencies[encoding])
+        return result
+
+    def snapshot(self, full_curve: bool = True) -> Dict:
+        """Copy of all statistics at this moment (does not interrupt sampling)"""
+        ranks, frequencies = self.ranks.rank_frequency_curve(compressed=not full_curve)
+        moments = self.complexity_moments
+        hist = self.complexity_histogram
+        return {
+            'timestamp': time.time(),
+            'elapsed_s': time.time() - self.start_time,
+            'successful_samples': self.ranks.total_samples,
+            'failures': dict(self.failures),
+            'n_phenotypes': self.ranks.n_phenotypes,
+            'rank_frequency': (ranks, frequencies),
+            'complexity_mean': moments.mean,
+            'complexity_std': moments.std,
+            'complexity_min': moments.min,
+            'complexity_max': moments.max,
+            'histogram_edges': hist.edges,
+            'histogram_counts': hist.counts.copy(),
+            'histogram_underflow': hist.underflow,
+            'histogram_overflow': hist.overflow,
+            'reference_ranks': self.reference_ranks(),
+        }
+
+    def save_snapshot(self, filepath: str):
+        """Append a compact JSON line (compressed rank curve) for monitoring long runs"""
+        snap = self.snapshot(full_curve=False)
+        ranks, frequencies = snap.pop('rank_frequency')
+        snap['rank_frequency'] = {'first_ranks': ranks.tolist(), 'frequencies': frequencies.tolist()}
+        snap['histogram_edges'] = snap['histogram_edges'].tolist()
+        snap['histogram_counts'] = snap['histogram_counts'].tolist()
+        snap['complexity_min'] = None if math.isinf(snap['complexity_min']) else snap['complexity_min']
+        snap['complexity_max'] = None if math.isinf(snap['complexity_max']) else snap['complexity_max']
+        with open(filepath, 'a') as f:
+            f.write(json.dumps(snap) + "\n")
+
+    def format_progress(self) -> str:
+        """One-line summary to append to print_progress output"""
+        moments = self.complexity_moments
+        parts = [f"phenotypes: {self.ranks.n_phenotypes:,}",
+                 f"CLZ: {moments.mean:.2f}±{moments.std:.2f}"]
+        for name, value in self.reference_ranks().items():
+            if value is None:
+                parts.append(f"{name}: not seen")
+            else:
+                rank, freq = value
+                parts.append(f"{name}: rank {rank:,} (freq {freq:,})")
+        return " | ".join(parts)
+
+def print_progress_with_stats(i, total, start_time, stats: LiveSamplingStatistics, interval=0.01):
+    """print_progress variant that also reports live phenotype statistics"""
+    interval_size = max(1, int(total * interval))
+    if (i + 1) % interval_size == 0 or i == 0 or i == total - 1:
+        elapsed = time.time() - start_time
+        progress = (i + 1) / total
+        rate = (i + 1) / elapsed if elapsed > 0 else 0.0
+        skipped = sum(stats.failures.values())
+        print(f"{i+1}/{total} ({progress*100:.1f}%) | success: {stats.ranks.total_samples} | "
+              f"skip: {skipped} | rate: {rate:.1f}/s | {stats.format_progress()}")
+
+if __name__ == "__main__":
+    # Example usage
+    print("LiveSamplingStatistics - incremental rank/frequency and complexity statistics")
+    print("Call stats.update(encoding, complexity) per sample and stats.snapshot() at any time")
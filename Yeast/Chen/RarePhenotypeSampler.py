@@ -0,0 +1,303 @@
+"""
+Targeted Rare-Phenotype Sampler
+Wang-Landau flat-histogram walk over the discrete multiplier lattice that spends
+integrations on the low- and high-complexity tails, with reweighting so that
+uniform-sampling phenotype frequencies can still be recovered
+"""
+
+import numpy as np
+import math
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+MULTIPLIERS = [0.25, 0.50, 0.75, 1.00, 1.25, 1.50, 1.75, 2.00]
+
+# evaluate(factors) -> (encoding, complexity[, period, coarse_data]) or None if rejected
+Evaluator = Callable[[np.ndarray], Optional[Tuple]]
+
+def make_roadrunner_evaluator(rr, kinetic_params: Sequence[str], default_values: Dict[str, float],
+                              simulate_fn: Callable, encode_fn: Callable,
+                              complexity_fn: Callable) -> Evaluator:
+    """
+    Wrap a RoadRunner model and the notebook pipeline functions into an evaluator
+
+    Args:
+        simulate_fn: e.g. simulate_and_extract_paper_method(rr) -> (time, clb2, period, coarse_data)
+        encode_fn: e.g. up_down_encoding_paper_method(coarse_time, coarse_signal)
+        complexity_fn: e.g. CLZ
+    """
+    def evaluate(factors):
+        for pid, value in default_values.items():
+            try:
+                rr.setValue(pid, value)
+            except RuntimeError:
+                continue
+        rr.resetAll()
+        for pid, factor in zip(kinetic_params, factors):
+            try:
+                rr.setValue(pid, default_values[pid] * factor)
+            except RuntimeError:
+                continue
+
+        full_time, _, period, coarse_data = simulate_fn(rr)
+        if isinstance(full_time, str) or period is None or coarse_data is None:
+            return None
+        encoding = encode_fn(*coarse_data)
+        return encoding, complexity_fn(encoding), period, coarse_data
+
+    return evaluate
+
+class WangLandauSampler:
+    """Flat-histogram sampling of complexity levels over the multiplier lattice
+
+    The walk proposes changing a few parameters to another multiplier (a symmetric move
+    on the lattice) and accepts with min(1, g(E_old) / g(E_new)), where E is the CLZ level
+    and g its running density-of-states estimate. Rare levels get small g and are therefore
+    visited as often as common ones. Genotypes whose integration is rejected (divergent,
+    no oscillation, long period) are never entered, so all estimates are conditional on a
+    successful simulation, exactly like the frequencies from uniform sampling.
+    """
+
+    def __init__(self, evaluate: Evaluator, n_params: int,
+                 multipliers: Sequence[float] = MULTIPLIERS,
+                 bin_size: Optional[float] = None, n_mutations: int = 1,
+                 flatness: float = 0.8, ln_f_initial: float = 1.0, ln_f_final: float = 1e-3,
+                 check_interval: int = 1000, seed: Optional[int] = None, tracker=None):
+        """
+        Args:
+            bin_size: Width of complexity levels; None uses each distinct CLZ value as a level
+            n_mutations: Parameters changed per proposal
+            flatness: Histogram is flat when min(H) >= flatness * mean(H) over visited levels
+            tracker: Optional PhenotypeTrackerWithRepresentatives fed with every successful
+                     evaluation (its frequencies are then evaluation counts, not unbiased)
+        """
+        self.evaluate = evaluate
+        self.n_params = n_params
+        self.multipliers = np.asarray(multipliers, dtype=float)
+        self.bin_size = bin_size
+        self.n_mutations = n_mutations
+        self.flatness = flatness
+        self.ln_f = ln_f_initial
+        self.ln_f_final = ln_f_final
+        self.check_interval = check_interval
+        self.rng = np.random.default_rng(seed)
+        self.tracker = tracker
+
+        # Density of states and visit histogram per complexity level
+        self.ln_g: Dict[float, float] = {}
+        self.histogram: Counter = Counter()
+        self.level_complexity: Dict[float, float] = {}
+        # Levels first reached while ln_g was frozen: their ln_g is a placeholder, not an estimate
+        self.unestimated_levels: set = set()
+        self._frozen = False
+
+        # Current state
+        self.state: Optional[np.ndarray] = None
+        self.state_encoding: Optional[str] = None
+        self.state_level: Optional[float] = None
+
+        # Production-phase visits (ln_g frozen)
+        self.visits: Counter = Counter()
+        self.phenotype_level: Dict[str, float] = {}
+        self.complexities: Dict[str, float] = {}
+
+        # Statistics
+        self.n_evaluations = 0
+        self.n_failed = 0
+        self.n_accepted = 0
+        self.n_steps = 0
+        self.flat_iterations = 0
+        self.adapted = False
+
+    def _level(self, complexity: float) -> float:
+        if self.bin_size is None:
+            return round(complexity, 6)
+        return round(complexity / self.bin_size) * self.bin_size
+
+    def _evaluate(self, indices: np.ndarray):
+        """Evaluate a lattice point, returning (encoding, complexity, level) or None"""
+        factors = self.multipliers[indices]
+        self.n_evaluations += 1
+        result = self.evaluate(factors)
+        if result is None:
+            self.n_failed += 1
+            return None
+
+        encoding, complexity = result[0], result[1]
+        level = self._level(complexity)
+        if level not in self.ln_g:
+            # New level: start at the lowest known density so it is not over-favoured
+            self.ln_g[level] = min(self.ln_g.values()) if self.ln_g else 0.0
+            self.level_complexity[level] = complexity
+            if self._frozen:
+                self.unestimated_levels.add(level)
+        self.complexities.setdefault(encoding, complexity)
+
+        if self.tracker is not None and len(result) >= 4:
+            self.tracker.update(encoding, complexity, result[2], genotype=factors.tolist(),
+                                coarse_data=result[3])
+        return encoding, complexity, level
+
+    def initialize(self, max_attempts: int = 1000):
+        """Draw uniform lattice points until one integrates successfully"""
+        for _ in range(max_attempts):
+            indices = self.rng.integers(len(self.multipliers), size=self.n_params)
+            evaluated = self._evaluate(indices)
+            if evaluated is not None:
+                self.state = indices
+                self.state_encoding, _, self.state_level = evaluated
+                return
+        raise RuntimeError(f"No successful integration in {max_attempts} uniform draws")
+
+    def _propose(self) -> np.ndarray:
+        proposal = self.state.copy()
+        positions = self.rng.choice(self.n_params, size=self.n_mutations, replace=False)
+        n_levels = len(self.multipliers)
+        for p in positions:
+            # Uniform over the other n_levels - 1 multipliers keeps the move symmetric
+            shift = self.rng.integers(1, n_levels)
+            proposal[p] = (proposal[p] + shift) % n_levels
+        return proposal
+
+    def step(self, adapt: bool = True):
+        """One Metropolis step; updates ln_g when adapting, records visits otherwise"""
+        self._frozen = not adapt
+        if self.state is None:
+            self.initialize()
+        self.n_steps += 1
+
+        proposal = self._propose()
+        evaluated = self._evaluate(proposal)
+        if evaluated is not None:
+            encoding, _, level = evaluated
+            log_accept = self.ln_g[self.state_level] - self.ln_g[level]
+            if log_accept >= 0 or self.rng.random() < math.exp(log_accept):
+                self.state = proposal
+                self.state_encoding = encoding
+                self.state_level = level
+                self.n_accepted += 1
+
+        if adapt:
+            self.ln_g[self.state_level] += self.ln_f
+            self.histogram[self.state_level] += 1
+            self.unestimated_levels.discard(self.state_level)
+        else:
+            self.visits[self.state_encoding] += 1
+            self.phenotype_level[self.state_encoding] = self.state_level
+
+    def is_flat(self) -> bool:
+        """Flatness over the levels visited so far"""
+        if len(self.histogram) < 2:
+            return False
+        counts = np.array(list(self.histogram.values()), dtype=float)
+        return counts.min() >= self.flatness * counts.mean()
+
+    def run_adaptation(self, max_steps: int = 100000, verbose: bool = True):
+        """Refine ln_g until ln_f < ln_f_final or max_steps is reached"""
+        start_time = time.time()
+        for i in range(max_steps):
+            self.step(adapt=True)
+            if (i + 1) % self.check_interval == 0:
+                if self.is_flat():
+                    self.ln_f /= 2
+                    self.histogram.clear()
+                    self.flat_iterations += 1
+                if verbose:
+                    self._print_progress("adapt", i, max_steps, start_time)
+                if self.ln_f < self.ln_f_final:
+                    self.adapted = True
+                    break
+        if verbose and not self.adapted:
+            print(f"⚠️  Adaptation stopped at ln_f={self.ln_f:.2e} (target {self.ln_f_final:.0e}); "
+                  f"ln_g is usable but less accurate")
+
+    def run_production(self, n_steps: int = 100000, verbose: bool = True):
+        """Sample with frozen ln_g, recording visits for reweighting"""
+        start_time = time.time()
+        for i in range(n_steps):
+            self.step(adapt=False)
+            if verbose and (i + 1) % self.check_interval == 0:
+                self._print_progress("production", i, n_steps, start_time)
+
+    def run(self, n_adaptation: int = 100000, n_production: int = 100000, verbose: bool = True):
+        self.run_adaptation(n_adaptation, verbose)
+        self.run_production(n_production, verbose)
+        return self
+
+    def _print_progress(self, phase, i, total, start_time):
+        elapsed = time.time() - start_time
+        rate = (i + 1) / elapsed if elapsed > 0 else 0.0
+        acceptance = self.n_accepted / self.n_steps if self.n_steps else 0.0
+        print(f"[{phase}] {i+1}/{total} | levels: {len(self.ln_g)} | ln_f: {self.ln_f:.2e} | "
+              f"accept: {acceptance*100:.1f}% | failed evals: {self.n_failed:,} | rate: {rate:.1f}/s")
+
+    def complexity_distribution(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Estimated probability of each complexity level under uniform lattice sampling
+
+        Levels first reached during production are excluded (see unestimated_levels):
+        their density was never adapted, so they have no probability estimate.
+
+        Returns:
+            (complexities, probabilities) sorted by complexity
+        """
+        levels = sorted(l for l in self.ln_g if l not in self.unestimated_levels)
+        ln_g = np.array([self.ln_g[l] for l in levels])
+        weights = np.exp(ln_g - ln_g.max())
+        complexities = np.array([self.level_complexity[l] for l in levels])
+        return complexities, weights / weights.sum()
+
+    def reweighted_frequencies(self, n_equivalent: Optional[int] = None) -> Dict[str, float]:
+        """
+        Unbiased phenotype frequencies from the production visits
+
+        A visit to a state at level E carries weight g(E), which undoes the 1/g(E) bias
+        of the walk. Phenotypes on levels without an adapted g(E) are left out; they are
+        available, unweighted, from unestimated_visits().
+
+        Args:
+            n_equivalent: Scale probabilities to counts of an equivalent uniform run
+        """
+        if not self.visits:
+            raise RuntimeError("No production samples; call run_production() first")
+        estimated = {level: ln_g for level, ln_g in self.ln_g.items() if level not in self.unestimated_levels}
+        if not estimated:
+            raise RuntimeError("No complexity level has an adapted density; call run_adaptation() first")
+        max_ln_g = max(estimated.values())
+        weights = {
+            encoding: count * math.exp(estimated[self.phenotype_level[encoding]] - max_ln_g)
+            for encoding, count in self.visits.items()
+            if self.phenotype_level[encoding] in estimated
+        }
+        total = sum(weights.values())
+        scale = (n_equivalent or 1) / total
+        return {encoding: w * scale for encoding, w in weights.items()}
+
+    def unestimated_visits(self) -> Counter:
+        """Production visits to phenotypes whose level was never adapted (raw counts)"""
+        return Counter({encoding: count for encoding, count in self.visits.items()
+                        if self.phenotype_level[encoding] in self.unestimated_levels})
+
+    def summary(self):
+        """Print sampler statistics and the estimated complexity distribution tails"""
+        print("\n=== WANG-LANDAU SAMPLER SUMMARY ===")
+        print(f"Steps: {self.n_steps:,} | Evaluations: {self.n_evaluations:,} | "
+              f"Failed: {self.n_failed:,} | Accepted: {self.n_accepted:,}")
+        print(f"Flat iterations: {self.flat_iterations} | ln_f: {self.ln_f:.2e} | "
+              f"Converged: {self.adapted}")
+        print(f"Complexity levels found: {len(self.ln_g)} | Distinct phenotypes: {len(self.complexities):,}")
+        complexities, probabilities = self.complexity_distribution()
+        for c, p in zip(complexities, probabilities):
+            print(f"   CLZ {c:6.2f}: P = {p:.3e}")
+        if self.unestimated_levels:
+            levels = ", ".join(f"{self.level_complexity[l]:.2f}" for l in sorted(self.unestimated_levels))
+            print(f"⚠️  Levels first found in production (no density estimate, excluded): CLZ {levels}")
+
+if __name__ == "__main__":
+    # Example usage
+    print("WangLandauSampler - flat-histogram sampling of rare complexity levels")
+    print("evaluate = make_roadrunner_evaluator(rr, kinetic_params, default_values,")
+    print("                                     simulate_and_extract_paper_method,")
+    print("                                     up_down_encoding_paper_method, CLZ)")
+    print("WangLandauSampler(evaluate, len(kinetic_params), tracker=tracker).run()")
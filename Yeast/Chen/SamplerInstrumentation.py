@@ -0,0 +1,316 @@
+"""
+Sampler Hot-Path Instrumentation
+Per-stage timers with streaming latency histograms, skip/failure counters,
+per-worker breakdowns, periodic JSON-lines export and opt-in cProfile sampling
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+class LatencyHistogram:
+    """Streaming log-scale latency histogram (4 sub-buckets per power of two, in ns)"""
+
+    SUB_BUCKETS = 4
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @classmethod
+    def _bucket(cls, ns: int) -> int:
+        if ns < cls.SUB_BUCKETS:
+            return ns
+        octave = ns.bit_length() - 1
+        sub = (ns >> (octave - 2)) & (cls.SUB_BUCKETS - 1)
+        return octave * cls.SUB_BUCKETS + sub
+
+    @classmethod
+    def _bucket_midpoint(cls, bucket: int) -> float:
+        if bucket < cls.SUB_BUCKETS:
+            return float(bucket)
+        octave, sub = divmod(bucket, cls.SUB_BUCKETS)
+        low = (cls.SUB_BUCKETS + sub) << (octave - 2)
+        return low + (1 << (octave - 2)) / 2
+
+    def record(self, ns: int):
+        self.buckets[self._bucket(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile in ns (within ~12% relative error)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return self._bucket_midpoint(bucket)
+        return float(self.max_ns)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_ms': self.total_ns / 1e6,
+            'mean_ms': self.total_ns / self.count / 1e6 if self.count else 0.0,
+            'p50_ms': self.quantile(0.50) / 1e6,
+            'p90_ms': self.quantile(0.90) / 1e6,
+            'p99_ms': self.quantile(0.99) / 1e6,
+            'max_ms': self.max_ns / 1e6,
+            'buckets': {str(k): v for k, v in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        hist = cls()
+        hist.buckets = Counter({int(k): v for k, v in data['buckets'].items()})
+        hist.count = data['count']
+        hist.total_ns = int(round(data['total_ms'] * 1e6))
+        hist.max_ns = int(round(data['max_ms'] * 1e6))
+        return hist
+
+class _StageTimer:
+    """Reusable context manager for one named stage"""
+
+    __slots__ = ('histogram', '_start')
+
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter_ns() - self._start)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class SamplerInstrumentation:
+    """Low-overhead instrumentation for the sampling loop
+
+    Usage:
+        instr = SamplerInstrumentation(export_path="timings.jsonl", profile_every=1000)
+        for i in range(N):
+            with instr.profile_sample(i):
+                with instr.stage('integrate'):
+                    ...
+                instr.count('divergent')
+            instr.sample_done()
+    """
+
+    def __init__(self, enabled: bool = True, worker_id: Optional[str] = None,
+                 export_path: Optional[str] = None, export_interval_s: float = 60.0,
+                 profile_every: int = 0):
+        """
+        Args:
+            worker_id: Label for per-worker breakdowns (defaults to the process id)
+            export_path: JSON-lines file that receives a snapshot every export_interval_s
+            profile_every: Run cProfile on every k-th sample (0 disables profiling)
+        """
+        self.enabled = enabled
+        self.worker_id = worker_id or f"pid{os.getpid()}"
+        self.export_path = export_path
+        self.export_interval_s = export_interval_s
+        self.profile_every = profile_every
+
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self._timers: Dict[str, _StageTimer] = {}
+        self.counters = Counter()
+        self.samples = 0
+        self.start_time = time.time()
+        self._last_export = self.start_time
+
+        self.profiler = cProfile.Profile() if profile_every else None
+        self.profiled_samples = 0
+
+    def stage(self, name: str):
+        """Context manager timing one stage of the current sample"""
+        if not self.enabled:
+            return _NULL_TIMER
+        timer = self._timers.get(name)
+        if timer is None:
+            histogram = self.stages.setdefault(name, LatencyHistogram())
+            timer = self._timers[name] = _StageTimer(histogram)
+        return timer
+
+    def record(self, name: str, ns: int):
+        """Record an externally measured stage duration"""
+        if self.enabled:
+            self.stages.setdefault(name, LatencyHistogram()).record(ns)
+
+    def count(self, name: str, n: int = 1):
+        """Increment a counter (skip reasons, integrator failures, ...)"""
+        if self.enabled:
+            self.counters[name] += n
+
+    def profile_sample(self, i: int):
+        """Context manager that profiles sample i if it is a k-th sample"""
+        if self.profiler is None or i % self.profile_every != 0:
+            return _NULL_TIMER
+        self.profiled_samples += 1
+        return _ProfiledSample(self.profiler)
+
+    def sample_done(self):
+        """Mark the end of one sample; exports a snapshot when the interval has elapsed"""
+        self.samples += 1
+        if self.export_path and self.enabled:
+            now = time.time()
+            if now - self._last_export >= self.export_interval_s:
+                self.export()
+                self._last_export = now
+
+    def snapshot(self) -> Dict:
+        elapsed = time.time() - self.start_time
+        return {
+            'timestamp': time.time(),
+            'worker': self.worker_id,
+            'start_time': self.start_time,
+            'elapsed_s': elapsed,
+            'samples': self.samples,
+            'rate_per_s': self.samples / elapsed if elapsed > 0 else 0.0,
+            'stages': {name: hist.to_dict() for name, hist in self.stages.items()},
+            'counters': dict(self.counters),
+            'profiled_samples': self.profiled_samples,
+        }
+
+    def export(self, filepath: Optional[str] = None):
+        """Append the current snapshot as one JSON line"""
+        filepath = filepath or self.export_path
+        with open(filepath, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def profile_stats(self, top: int = 20, sort_by: str = "cumulative") -> str:
+        """Formatted cProfile output accumulated over the profiled samples"""
+        if self.profiler is None or self.profiled_samples == 0:
+            return "No profiled samples"
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort_by).print_stats(top)
+        return stream.getvalue()
+
+    def dump_profile(self, filepath: str):
+        """Write accumulated cProfile data for snakeviz / pstats"""
+        if self.profiler is not None:
+            self.profiler.dump_stats(filepath)
+
+    def report(self):
+        """Print per-stage latency table and counters"""
+        print_instrumentation_report(self.snapshot())
+
+class _ProfiledSample:
+    __slots__ = ('profiler',)
+
+    def __init__(self, profiler: cProfile.Profile):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        return False
+
+def merge_instrumentation_snapshots(snapshots: List[Dict], wall_time_s: Optional[float] = None) -> Dict:
+    """
+    Combine worker snapshots (e.g. returned by process_batch_worker) into totals
+    while keeping the per-worker breakdown
+
+    Snapshots are cumulative, so only the latest one per instrumentation instance
+    (worker, start_time) is counted. A worker's elapsed time is the sum over its
+    instances; the overall elapsed time is wall_time_s if given, otherwise the span
+    from the earliest start to the latest snapshot.
+    """
+    latest: Dict[Tuple[str, float], Dict] = {}
+    for snap in snapshots:
+        start = snap.get('start_time', snap['timestamp'] - snap['elapsed_s'])
+        key = (snap['worker'], start)
+        if key not in latest or snap['timestamp'] >= latest[key]['timestamp']:
+            latest[key] = snap
+
+    stages: Dict[str, LatencyHistogram] = {}
+    counters = Counter()
+    samples = 0
+    per_worker = {}
+    for (worker_id, _), snap in latest.items():
+        samples += snap['samples']
+        counters.update(snap['counters'])
+        for name, data in snap['stages'].items():
+            stages.setdefault(name, LatencyHistogram()).merge(LatencyHistogram.from_dict(data))
+
+        worker = per_worker.setdefault(worker_id, {'samples': 0, 'elapsed_s': 0.0, 'counters': Counter()})
+        worker['samples'] += snap['samples']
+        worker['elapsed_s'] += snap['elapsed_s']
+        worker['counters'].update(snap['counters'])
+
+    for worker in per_worker.values():
+        worker['rate_per_s'] = worker['samples'] / worker['elapsed_s'] if worker['elapsed_s'] > 0 else 0.0
+        worker['counters'] = dict(worker['counters'])
+
+    if wall_time_s is not None:
+        elapsed = wall_time_s
+    elif latest:
+        elapsed = (max(snap['timestamp'] for snap in latest.values())
+                   - min(start for _, start in latest))
+    else:
+        elapsed = 0.0
+    return {
+        'timestamp': time.time(),
+        'worker': 'all',
+        'elapsed_s': elapsed,
+        'samples': samples,
+        'rate_per_s': samples / elapsed if elapsed > 0 else 0.0,
+        'stages': {name: hist.to_dict() for name, hist in stages.items()},
+        'counters': dict(counters),
+        'per_worker': per_worker,
+    }
+
+def print_instrumentation_report(snapshot: Dict):
+    """Print a snapshot (single worker or merged) as a table"""
+    print(f"\n=== SAMPLER INSTRUMENTATION ({snapshot['worker']}) ===")
+    print(f"Samples: {snapshot['samples']:,} | Elapsed: {snapshot['elapsed_s']/60:.1f}m | "
+          f"Rate: {snapshot['rate_per_s']:.1f}/s")
+    stages = snapshot['stages']
+    total_ms = sum(s['total_ms'] for s in stages.values()) or 1.0
+    print(f"{'stage':<20} {'count':>10} {'mean ms':>10} {'p50 ms':>10} {'p99 ms':>10} {'share':>7}")
+    print("-" * 72)
+    for name, s in sorted(stages.items(), key=lambda x: -x[1]['total_ms']):
+        print(f"{name:<20} {s['count']:>10,} {s['mean_ms']:>10.3f} {s['p50_ms']:>10.3f} "
+              f"{s['p99_ms']:>10.3f} {s['total_ms']/total_ms*100:>6.1f}%")
+    if snapshot['counters']:
+        print("Counters: " + ", ".join(f"{k}={v:,}" for k, v in sorted(snapshot['counters'].items())))
+    for worker, w in sorted(snapshot.get('per_worker', {}).items()):
+        print(f"   {worker}: {w['samples']:,} samples, {w['rate_per_s']:.1f}/s, {w['counters']}")
+
+if __name__ == "__main__":
+    # Example usage
+    print("SamplerInstrumentation - per-stage timers, counters and cProfile sampling")
+    print("Wrap each stage with `with instr.stage('integrate'):` and call instr.report() at the end")
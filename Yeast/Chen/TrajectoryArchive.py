@@ -0,0 +1,474 @@
+"""
+Compressed Trajectory Archive
+Downsampled, chunked, memory-mappable trajectories written during sampling, so
+encodings, periods and CLZ can be recomputed with different methods without
+re-running any integration
+"""
+
+import glob
+import json
+import os
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from VectorizedPhenotypes import (CLZ, DIVERGENT, LONG_PERIOD, NO_OSCILLATION, STATUS_NAMES, VALID,
+                                  bits_to_strings, encode_species_matrix)
+
+STORAGE_FORMATS = ("float64", "float32", "float16", "quantized16")
+
+# Default for reanalyze thresholds: use the sampling run's settings stored in the archive
+FROM_ARCHIVE = "archive"
+
+class TrajectoryArchiveWriter:
+    """Append-only archive part: one .npy file per chunk of trajectories
+
+    Storage formats (bytes per value):
+        'float64': 8 bytes; the integrator output as is, re-encodes exactly (downsample=1)
+        'float32': 4 bytes
+        'float16': 2 bytes; each (sample, species) series is divided by its max |value|
+                   (stored as float32) before the cast, so large concentrations cannot overflow
+        'quantized16': 2 bytes; per-series offset/scale plus uint16 codes over the
+                       series' own range
+
+    Every format except float64 rounds the trajectories, and rounding can flip the slope
+    sign of flat stretches, float32 included. How many encodings survive depends on the
+    model, so check any such archive with verify_archive before relying on it. When
+    append() receives the live phenotypes, their status and packed codes are stored
+    alongside the trajectories for that check.
+    """
+
+    def __init__(self, directory: str, time: np.ndarray, species: Sequence[str],
+                 storage: str = "float32", downsample: int = 1, chunk_size: int = 10000,
+                 multipliers: Optional[Sequence[float]] = None, max_period: Optional[float] = None,
+                 diverge_threshold: Optional[float] = None, coarse_bins: int = 50):
+        """
+        Args:
+            max_period, diverge_threshold, coarse_bins: Encoding settings of the sampling run,
+                stored in metadata.json as the re-analysis defaults
+        """
+        if storage not in STORAGE_FORMATS:
+            raise ValueError(f"storage must be one of {STORAGE_FORMATS}")
+        self.directory = directory
+        self.species = list(species)
+        self.storage = storage
+        self.downsample = downsample
+        self.chunk_size = chunk_size
+        self.multipliers = list(multipliers) if multipliers is not None else None
+        self.time = np.asarray(time, dtype=np.float64)[::downsample]
+        self.max_period = max_period
+        self.diverge_threshold = diverge_threshold
+        self.coarse_bins = coarse_bins
+
+        self.n_samples = 0
+        self.n_chunks = 0
+        self._values: List[np.ndarray] = []
+        self._genotypes: List[np.ndarray] = []
+        self._live_status: List[Optional[np.ndarray]] = []
+        self._live_codes: List[Optional[np.ndarray]] = []
+        if os.path.exists(os.path.join(directory, "metadata.json")):
+            # Chunk files would be overwritten in place and mixed with the old part
+            raise FileExistsError(f"{directory} already holds an archive part")
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, Y: np.ndarray, genotype_indices: Optional[Sequence[int]] = None, phenotypes=None):
+        """
+        Add one (timepoints x species) trajectory on the archive's original time grid
+
+        Args:
+            phenotypes: MultiSpeciesPhenotypes computed live from Y, kept for verify_archive
+        """
+        Y = np.asarray(Y).reshape(-1, len(self.species))[::self.downsample]
+        if Y.shape[0] != len(self.time):
+            raise ValueError(f"Expected {len(self.time)} timepoints after downsampling, got {Y.shape[0]}")
+        self._values.append(Y)
+        self._genotypes.append(np.asarray(genotype_indices if genotype_indices is not None else [],
+                                          dtype=np.uint8))
+        if phenotypes is not None and phenotypes.codes is not None:
+            self._live_status.append(np.asarray(phenotypes.status, dtype=np.int8))
+            self._live_codes.append(np.where(phenotypes.valid, phenotypes.codes, 0).astype(np.uint64))
+        else:
+            self._live_status.append(None)
+            self._live_codes.append(None)
+        self.n_samples += 1
+        if len(self._values) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered trajectories as the next chunk"""
+        if not self._values:
+            return
+        values = np.stack(self._values)
+        stem = os.path.join(self.directory, f"chunk_{self.n_chunks:05d}")
+
+        if self.storage in ("float64", "float32"):
+            np.save(stem + "_values.npy", values.astype(self.storage))
+        elif self.storage == "float16":
+            scale = np.abs(values).max(axis=1, keepdims=True)
+            scale = np.where(scale > 0, scale, 1.0)
+            np.save(stem + "_values.npy", (values / scale).astype(np.float16))
+            np.save(stem + "_scale.npy", scale[:, 0, :].astype(np.float32))
+        else:
+            low = values.min(axis=1, keepdims=True)
+            span = values.max(axis=1, keepdims=True) - low
+            scale = np.where(span > 0, span / 65535.0, 1.0)
+            codes = np.round((values - low) / scale).astype(np.uint16)
+            np.save(stem + "_values.npy", codes)
+            np.save(stem + "_offset.npy", low[:, 0, :].astype(np.float32))
+            np.save(stem + "_scale.npy", scale[:, 0, :].astype(np.float32))
+
+        if any(len(g) for g in self._genotypes):
+            np.save(stem + "_genotypes.npy", np.stack(self._genotypes))
+        if all(st is not None for st in self._live_status):
+            np.save(stem + "_live_status.npy", np.stack(self._live_status))
+            np.save(stem + "_live_codes.npy", np.stack(self._live_codes))
+
+        self.n_chunks += 1
+        self._values.clear()
+        self._genotypes.clear()
+        self._live_status.clear()
+        self._live_codes.clear()
+        self._write_metadata()
+
+    def _write_metadata(self):
+        metadata = {
+            'species': self.species,
+            'time': self.time.tolist(),
+            'storage': self.storage,
+            'downsample': self.downsample,
+            'chunk_size': self.chunk_size,
+            'n_samples': self.n_samples - len(self._values),
+            'n_chunks': self.n_chunks,
+            'multipliers': self.multipliers,
+            'max_period': self.max_period,
+            'diverge_threshold': self.diverge_threshold,
+            'coarse_bins': self.coarse_bins,
+        }
+        tmp_path = os.path.join(self.directory, f"metadata.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, os.path.join(self.directory, "metadata.json"))
+
+    def close(self):
+        self.flush()
+        self._write_metadata()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+def new_run_directory(archive_dir: str, seed: int) -> str:
+    """Create a fresh run_<timestamp>_<pid>_seed<seed> directory for one sampling run's parts"""
+    run_dir = os.path.join(archive_dir, f"run_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_seed{seed}")
+    os.makedirs(run_dir)
+    return run_dir
+
+class TrajectoryArchive:
+    """Reader over one archive part or one run directory holding several parts (e.g. one per worker)
+
+    A directory of runs (as created by ChenPipeline --archive) is accepted when it holds
+    a single run; with several runs, one of them has to be chosen explicitly.
+    """
+
+    def __init__(self, root: str):
+        if os.path.exists(os.path.join(root, "metadata.json")):
+            self.parts = [root]
+        else:
+            self.parts = sorted(os.path.dirname(p) for p in glob.glob(os.path.join(root, "*", "metadata.json")))
+        if not self.parts:
+            runs = sorted({os.path.dirname(os.path.dirname(p))
+                           for p in glob.glob(os.path.join(root, "*", "*", "metadata.json"))})
+            if len(runs) > 1:
+                raise ValueError(f"{root} holds {len(runs)} sampling runs; open one of them:\n"
+                                 + "\n".join(f"  {run}" for run in runs))
+            if runs:
+                self.parts = sorted(os.path.dirname(p) for p in glob.glob(os.path.join(runs[0], "*", "metadata.json")))
+        if not self.parts:
+            raise FileNotFoundError(f"No trajectory archive found in {root}")
+
+        self.metadata = []
+        for part in self.parts:
+            with open(os.path.join(part, "metadata.json")) as f:
+                self.metadata.append(json.load(f))
+
+        first = self.metadata[0]
+        for meta in self.metadata[1:]:
+            if meta['species'] != first['species'] or meta['time'] != first['time']:
+                raise ValueError("Archive parts have different species or time grids")
+            if (meta.get('max_period'), meta.get('diverge_threshold')) != \
+                    (first.get('max_period'), first.get('diverge_threshold')):
+                raise ValueError("Archive parts were sampled with different rejection thresholds")
+        self.species = first['species']
+        self.time = np.asarray(first['time'])
+        self.multipliers = first.get('multipliers')
+        self.max_period = first.get('max_period')
+        self.diverge_threshold = first.get('diverge_threshold')
+        self.coarse_bins = first.get('coarse_bins', 50)
+
+    def __len__(self):
+        return sum(meta['n_samples'] for meta in self.metadata)
+
+    def iter_chunks(self, dtype=np.float32) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Yield (values, genotypes) per chunk; values has shape (n, timepoints, species)
+
+        Chunk files are memory-mapped, so only the chunk being decoded is held in memory.
+        """
+        for stem, meta in self._chunk_stems():
+            values = self._decode(stem, meta['storage'], dtype)
+            genotype_path = stem + "_genotypes.npy"
+            genotypes = np.load(genotype_path, mmap_mode='r') if os.path.exists(genotype_path) else None
+            yield values, genotypes
+
+    def _chunk_stems(self) -> Iterator[Tuple[str, Dict]]:
+        for part, meta in zip(self.parts, self.metadata):
+            for c in range(meta['n_chunks']):
+                yield os.path.join(part, f"chunk_{c:05d}"), meta
+
+    @staticmethod
+    def _decode(stem: str, storage: str, dtype, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decode a chunk (or only the given rows of it) to (n, timepoints, species)"""
+        select = slice(None) if rows is None else rows
+        raw = np.load(stem + "_values.npy", mmap_mode='r')[select]
+        if storage in ("float64", "float32"):
+            return raw.astype(dtype)
+        scale = np.load(stem + "_scale.npy")[select][:, None, :]
+        if storage == "float16":
+            return (raw.astype(dtype) * scale).astype(dtype)
+        offset = np.load(stem + "_offset.npy")[select][:, None, :]
+        return (raw.astype(dtype) * scale + offset).astype(dtype)
+
+    def sample_with_live(self, n: int, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Random rows stored with their live phenotypes
+
+        Returns:
+            (values, live_status, live_codes) with shapes (n, T, S), (n, S), (n, S)
+        """
+        chunks = [(stem, meta) for stem, meta in self._chunk_stems()
+                  if os.path.exists(stem + "_live_status.npy")]
+        if not chunks:
+            raise ValueError("Archive holds no live phenotypes to verify against")
+        sizes = np.array([len(np.load(stem + "_live_status.npy", mmap_mode='r')) for stem, _ in chunks])
+        rng = np.random.default_rng(seed)
+        picks = np.sort(rng.choice(sizes.sum(), size=min(n, sizes.sum()), replace=False))
+        chunk_of = np.searchsorted(np.cumsum(sizes), picks, side='right')
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        values, status, codes = [], [], []
+        for c in np.unique(chunk_of):
+            stem, meta = chunks[c]
+            rows = picks[chunk_of == c] - starts[c]
+            values.append(self._decode(stem, meta['storage'], np.float64, rows))
+            status.append(np.load(stem + "_live_status.npy", mmap_mode='r')[rows])
+            codes.append(np.load(stem + "_live_codes.npy", mmap_mode='r')[rows])
+        return np.concatenate(values), np.concatenate(status), np.concatenate(codes)
+
+def _resolve_thresholds(archive: "TrajectoryArchive", max_period, diverge_threshold):
+    if max_period == FROM_ARCHIVE:
+        max_period = archive.max_period
+    if diverge_threshold == FROM_ARCHIVE:
+        diverge_threshold = archive.diverge_threshold
+    return max_period, diverge_threshold
+
+def _encode_block(time_grid, block, method, coarse_bins, nbins, max_period, diverge_threshold,
+                  period_estimator):
+    """(status, periods, encodings) for every column of a (timepoints x columns) block"""
+    # Integrations that blew up to inf/NaN cannot be encoded
+    finite = np.isfinite(block).all(axis=0)
+    block[:, ~finite] = 0.0
+
+    if period_estimator is None:
+        result = encode_species_matrix(time_grid, block, [''] * block.shape[1], method=method,
+                                       coarse_bins=coarse_bins, nbins=nbins, max_period=max_period,
+                                       diverge_threshold=diverge_threshold)
+        block_status = result.status
+        block_periods = result.periods
+        block_encodings = bits_to_strings(result.bits)
+    else:
+        block_status, block_periods, block_encodings = _scalar_period_pass(
+            time_grid, block, period_estimator, max_period)
+        if diverge_threshold is not None:
+            block_status[np.any(np.abs(block) > diverge_threshold, axis=0)] = DIVERGENT
+    block_status[~finite] = DIVERGENT
+    return block_status, block_periods, block_encodings
+
+def reanalyze(archive: TrajectoryArchive, method: str = "paper", species: Optional[Sequence[str]] = None,
+              nbins: int = 50, coarse_bins: Optional[int] = None, max_period=FROM_ARCHIVE,
+              diverge_threshold=FROM_ARCHIVE, period_estimator: Optional[Callable] = None,
+              complexity_fn: Callable = CLZ, columns_per_pass: int = 4096,
+              verbose: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Recompute encodings, periods and complexities for every archived trajectory
+
+    Each (sample, species) series becomes one column of a (timepoints x columns) matrix,
+    so the vectorised kernels process thousands of series per pass.
+
+    Args:
+        method: "paper" or "bins" as in encode_species_matrix
+        coarse_bins, max_period, diverge_threshold: Default to the sampling run's settings
+                          stored in the archive, so only the method under comparison changes;
+                          pass None explicitly to disable a rejection threshold
+        period_estimator: Optional scalar estimator with the notebook signature
+                          f(time, signal) -> (period, (coarse_time, coarse_signal)), e.g. the
+                          variants in PeakDetectionComparison.ipynb; replaces the vectorised
+                          autocorrelation method (slower, but no re-simulation)
+        complexity_fn: Complexity of an encoding string (e.g. an alternative LZ variant)
+
+    Returns:
+        Dict of arrays shaped (n_samples, n_species): 'status', 'period', 'complexity',
+        'encoding' (object array of str / None), plus 'species'
+    """
+    max_period, diverge_threshold = _resolve_thresholds(archive, max_period, diverge_threshold)
+    coarse_bins = coarse_bins if coarse_bins is not None else archive.coarse_bins
+    species = list(species) if species is not None else archive.species
+    columns = [archive.species.index(s) for s in species]
+    time_grid = archive.time
+    n_total = len(archive)
+    S = len(species)
+
+    status = np.empty((n_total, S), dtype=np.int8)
+    periods = np.full((n_total, S), np.nan)
+    complexities = np.full((n_total, S), np.nan)
+    encodings = np.empty((n_total, S), dtype=object)
+
+    start_time = time.time()
+    offset = 0
+    for values, _ in archive.iter_chunks(np.float64):
+        values = values[:, :, columns]
+        n = values.shape[0]
+        # (n, T, S) -> (T, n * S): sample-major columns
+        flat = values.transpose(1, 0, 2).reshape(len(time_grid), n * S)
+        for c0 in range(0, n * S, columns_per_pass):
+            block = np.array(flat[:, c0:c0 + columns_per_pass])
+            rows, cols = np.divmod(np.arange(c0, c0 + block.shape[1]), S)
+            rows += offset
+
+            block_status, block_periods, block_encodings = _encode_block(
+                time_grid, block, method, coarse_bins, nbins, max_period, diverge_threshold,
+                period_estimator)
+
+            status[rows, cols] = block_status
+            periods[rows, cols] = block_periods
+            for r, c, st, enc in zip(rows, cols, block_status, block_encodings):
+                if st == VALID:
+                    encodings[r, c] = enc
+                    complexities[r, c] = complexity_fn(enc)
+        offset += n
+        if verbose:
+            elapsed = time.time() - start_time
+            print(f"Re-analysed {offset:,}/{n_total:,} trajectories ({offset/elapsed:.0f}/s)")
+
+    return {'species': np.array(species), 'status': status, 'period': periods,
+            'complexity': complexities, 'encoding': encodings}
+
+def verify_archive(archive: TrajectoryArchive, n_check: int = 1000, seed: Optional[int] = 0,
+                   verbose: bool = True) -> Dict[str, float]:
+    """
+    Re-encode a random sample of archived rows with the sampling run's settings and
+    compare against the phenotypes computed live from the full-precision trajectories
+
+    Returns:
+        Dict with 'n_checked' (series), 'status_match' (share of equal statuses) and
+        'encoding_match' (share of live-valid series re-encoded to the same phenotype)
+    """
+    values, live_status, live_codes = archive.sample_with_live(n_check, seed)
+    n, T, S = values.shape
+    block = values.transpose(1, 0, 2).reshape(T, n * S)
+    status, _, encodings = _encode_block(archive.time, block, "paper", archive.coarse_bins, 50,
+                                         archive.max_period, archive.diverge_threshold, None)
+    live_status = live_status.reshape(-1)
+    live_codes = live_codes.reshape(-1)
+
+    live_valid = live_status == VALID
+    same_encoding = np.array([status[j] == VALID and int(encodings[j], 2) == int(live_codes[j])
+                              for j in np.flatnonzero(live_valid)], dtype=bool)
+    result = {
+        'n_checked': int(n * S),
+        'status_match': float(np.mean(status == live_status)),
+        'encoding_match': float(same_encoding.mean()) if len(same_encoding) else float('nan'),
+    }
+    if verbose:
+        storages = sorted({meta['storage'] for meta in archive.metadata})
+        print(f"Verified {result['n_checked']:,} archived series ({', '.join(storages)}) against live phenotypes: "
+              f"status {result['status_match']*100:.2f}% | encoding {result['encoding_match']*100:.2f}% "
+              f"of {live_valid.sum():,} valid")
+    return result
+
+def _scalar_period_pass(time_grid, block, period_estimator, max_period):
+    """Apply a notebook-style scalar period estimator column by column"""
+    n_cols = block.shape[1]
+    block_status = np.full(n_cols, NO_OSCILLATION, dtype=np.int8)
+    block_periods = np.full(n_cols, np.nan)
+    block_encodings: List[Optional[str]] = [None] * n_cols
+    for j in range(n_cols):
+        try:
+            period, (coarse_time, coarse_signal) = period_estimator(time_grid, block[:, j])
+        except (ValueError, FloatingPointError, TypeError):
+            continue
+        if period is None or coarse_signal is None:
+            continue
+        block_periods[j] = period
+        if max_period is not None and period > max_period:
+            block_status[j] = LONG_PERIOD
+            continue
+        bits = np.diff(np.asarray(coarse_signal)) > 0
+        block_encodings[j] = ''.join('1' if b else '0' for b in bits)
+        block_status[j] = VALID
+    return block_status, block_periods, block_encodings
+
+def summarize_reanalysis(results: Dict[str, np.ndarray]):
+    """Print phenotype counts and complexity statistics per species"""
+    from collections import Counter
+    print("\n=== RE-ANALYSIS SUMMARY ===")
+    for j, name in enumerate(results['species']):
+        st = results['status'][:, j]
+        valid = st == VALID
+        counts = Counter(results['encoding'][valid, j])
+        failures = Counter(STATUS_NAMES[int(s)] for s in st[~valid])
+        comp = results['complexity'][valid, j]
+        print(f"   {name:<12} valid: {valid.sum():>9,} | phenotypes: {len(counts):>8,} | "
+              f"CLZ: {np.mean(comp) if len(comp) else float('nan'):.2f}±{np.std(comp) if len(comp) else float('nan'):.2f} | "
+              f"failures: {dict(failures)}")
+
+def _threshold_arg(value: str):
+    if value == FROM_ARCHIVE:
+        return FROM_ARCHIVE
+    return None if value.lower() == "none" else float(value)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-encode archived trajectories without re-simulation")
+    parser.add_argument("archive", help="Archive part or run directory")
+    parser.add_argument("--method", choices=["paper", "bins"], default="paper")
+    parser.add_argument("--nbins", type=int, default=50)
+    parser.add_argument("--coarse-bins", type=int, default=None, help="Default: sampling run setting")
+    parser.add_argument("--max-period", type=_threshold_arg, default=FROM_ARCHIVE,
+                        help="Default: sampling run setting; 'none' disables")
+    parser.add_argument("--diverge-threshold", type=_threshold_arg, default=FROM_ARCHIVE,
+                        help="Default: sampling run setting; 'none' disables")
+    parser.add_argument("--species", nargs="*", default=None)
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="First compare N re-encoded rows with the live phenotypes")
+    parser.add_argument("--output", default=None, help="Save results to this .npz file")
+    args = parser.parse_args()
+
+    archive = TrajectoryArchive(args.archive)
+    print(f"Archive: {len(archive):,} trajectories, {len(archive.species)} species, "
+          f"{len(archive.time)} timepoints")
+    if args.verify:
+        verify_archive(archive, args.verify)
+    results = reanalyze(archive, args.method, args.species, args.nbins, args.coarse_bins,
+                        args.max_period, args.diverge_threshold)
+    summarize_reanalysis(results)
+    if args.output:
+        np.savez(args.output, **results)
+        print(f"Saved results to {args.output}")
+
+if __name__ == "__main__":
+    main()
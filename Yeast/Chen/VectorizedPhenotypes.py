@@ -0,0 +1,341 @@
+"""
+Single-Pass Multi-Species Phenotype Encoding
+Vectorised period estimation, cycle extraction, up-down encoding and CLZ over a
+(timepoints x species) result, so one integration yields phenotypes for every readout
+"""
+
+import numpy as np
+import math
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+from PhenotypeRepresentativeStorage import PhenotypeTrackerWithRepresentatives
+from PhenotypeStatistics import LiveSamplingStatistics
+
+# Result codes per species
+VALID = 0
+NO_OSCILLATION = 1
+LONG_PERIOD = 2
+DIVERGENT = 3
+
+STATUS_NAMES = {VALID: 'valid', NO_OSCILLATION: 'no_oscillation',
+                LONG_PERIOD: 'longperiod', DIVERGENT: 'divergent'}
+
+def lz76_phrase_count(s: str) -> int:
+    n = len(s)
+    if n == 0:
+        return 0
+    i = 0
+    c = 1  # at least one phrase if n>0
+    k = 1
+    while i + k <= n:
+        if s[i:i+k] in s[:i]:
+            k += 1
+            if i + k - 1 > n:
+                c += 1
+                break
+        else:
+            c += 1
+            i += k
+            k = 1
+    return c
+
+@lru_cache(maxsize=1 << 20)
+def CLZ(x: str) -> float:
+    """Lempel-Ziv complexity (cached: the same phenotypes recur across samples and species)"""
+    n = len(x)
+    if x.count('0') == n or x.count('1') == n:
+        return math.log2(n)
+    else:
+        return math.log2(n) / 2 * (lz76_phrase_count(x) + lz76_phrase_count(x[::-1]))
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Pack a (n_series, n_bits<=64) boolean array into uint64 codes, first bit most significant"""
+    n_bits = bits.shape[-1]
+    weights = np.uint64(1) << np.arange(n_bits - 1, -1, -1, dtype=np.uint64)
+    return (bits.astype(np.uint64) * weights).sum(axis=-1, dtype=np.uint64)
+
+def bits_to_strings(bits: np.ndarray) -> List[str]:
+    """(n_series, n_bits) boolean array to '0101...' strings"""
+    chars = np.where(bits, ord('1'), ord('0')).astype(np.uint8)
+    return [row.tobytes().decode('ascii') for row in chars]
+
+def _interp_columns(time: np.ndarray, Y: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    np.interp applied per column: query has shape (Q, S) and column s of query is
+    interpolated against column s of Y
+    """
+    T, S = Y.shape
+    idx = np.searchsorted(time, query, side='right') - 1
+    idx = np.clip(idx, 0, T - 2)
+    t0 = time[idx]
+    t1 = time[idx + 1]
+    w = np.where(t1 > t0, (query - t0) / np.where(t1 > t0, t1 - t0, 1.0), 0.0)
+    w = np.clip(w, 0.0, 1.0)
+    cols = np.broadcast_to(np.arange(S), query.shape)
+    return Y[idx, cols] * (1 - w) + Y[idx + 1, cols] * w
+
+def up_down_encoding_matrix(time: np.ndarray, Y: np.ndarray, nbins: int = 50) -> np.ndarray:
+    """
+    Vectorised up_down_encoding (Fink method) for every column of Y
+
+    Returns:
+        (S, nbins) boolean array of slope signs
+    """
+    time = np.asarray(time, dtype=float)
+    Y = np.asarray(Y, dtype=float).reshape(len(time), -1)
+    dt = (time[-1] - time[0]) / nbins
+    t_eval = time[0] + dt * np.arange(1, nbins + 1)
+    t_eval = t_eval[t_eval <= time[-1]]
+    t_before = np.maximum(t_eval - dt / 10, time[0])
+
+    S = Y.shape[1]
+    q_now = np.repeat(t_eval[:, None], S, axis=1)
+    q_before = np.repeat(t_before[:, None], S, axis=1)
+    slopes = _interp_columns(time, Y, q_now) - _interp_columns(time, Y, q_before)
+    return (slopes >= 0).T
+
+def estimate_period_matrix(time: np.ndarray, Y: np.ndarray, transient_fraction: float = 0.2):
+    """
+    Vectorised estimate_period (autocorrelation method) for every column of Y
+
+    Returns:
+        periods: (S,) period in time units, NaN where no oscillation was found
+        cycle_bounds: (S, 2) [start, end) indices into time of one full cycle (-1 if invalid)
+    """
+    time = np.asarray(time, dtype=float)
+    Y = np.asarray(Y, dtype=float).reshape(len(time), -1)
+    S = Y.shape[1]
+
+    start_idx = int(transient_fraction * len(time))
+    time_subset = time[start_idx:]
+    X = Y[start_idx:]
+    n = X.shape[0]
+
+    std = X.std(axis=0)
+    mean = X.mean(axis=0)
+    usable = std > 0
+    Xn = np.where(usable, (X - mean) / np.where(usable, std, 1.0), 0.0)
+
+    # Autocorrelation of all columns at once (same as np.correlate(x, x, 'full')[n-1:])
+    nfft = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(Xn, nfft, axis=0)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), nfft, axis=0)[:n]
+
+    threshold = 0.5 * autocorr[1:].max(axis=0)
+    inner = autocorr[1:-1]
+    is_peak = (inner > autocorr[:-2]) & (inner > autocorr[2:]) & (inner > threshold)
+    has_peak = is_peak.any(axis=0) & usable
+    period_samples = np.where(has_peak, is_peak.argmax(axis=0) + 1, 0)
+
+    dt = time_subset[1] - time_subset[0]
+    periods = np.where(has_peak, period_samples * dt, np.nan)
+
+    # Centre the cycle window on the second signal peak above the mean
+    inner_x = X[1:-1]
+    signal_peaks = (inner_x > X[:-2]) & (inner_x > X[2:]) & (inner_x > mean)
+    n_peaks = np.cumsum(signal_peaks, axis=0)
+    has_two = n_peaks[-1] >= 2 if n > 2 else np.zeros(S, dtype=bool)
+    center = (n_peaks >= 2).argmax(axis=0) + 1
+
+    half = period_samples // 2
+    start = np.where(has_two, np.maximum(0, center - half), n - period_samples)
+    end = np.where(has_two, np.minimum(n, center + half), n)
+
+    valid = has_peak & (start >= 0) & (end - start >= 10)
+    cycle_bounds = np.where(valid[:, None], np.stack([start, end], axis=1) + start_idx, -1)
+    periods = np.where(valid, periods, np.nan)
+    return periods, cycle_bounds
+
+def coarse_grain_matrix(time: np.ndarray, Y: np.ndarray, cycle_bounds: np.ndarray,
+                        n_steps: int = 50):
+    """
+    Vectorised coarse_grain_to_50_steps for every valid column
+
+    Returns:
+        coarse_time, coarse_signal: (S, n_steps) arrays (NaN rows for invalid columns)
+    """
+    time = np.asarray(time, dtype=float)
+    Y = np.asarray(Y, dtype=float).reshape(len(time), -1)
+    valid = cycle_bounds[:, 0] >= 0
+    start = np.where(valid, cycle_bounds[:, 0], 0)
+    last = np.where(valid, cycle_bounds[:, 1] - 1, 1)
+
+    fractions = np.linspace(0.0, 1.0, n_steps)
+    coarse_time = time[start][:, None] + (time[last] - time[start])[:, None] * fractions
+    coarse_signal = _interp_columns(time, Y, coarse_time.T).T
+    coarse_time[~valid] = np.nan
+    coarse_signal[~valid] = np.nan
+    return coarse_time, coarse_signal
+
+def paper_encoding_matrix(coarse_signal: np.ndarray) -> np.ndarray:
+    """Vectorised up_down_encoding_paper_method: (S, n_steps - 1) boolean slope signs"""
+    return np.diff(coarse_signal, axis=1) > 0
+
+class MultiSpeciesPhenotypes:
+    """Phenotypes of every selected species from one simulation result"""
+
+    def __init__(self, species: Sequence[str], status: np.ndarray, periods: np.ndarray,
+                 bits: np.ndarray, coarse_time: Optional[np.ndarray] = None,
+                 coarse_signal: Optional[np.ndarray] = None):
+        self.species = list(species)
+        self.status = status
+        self.periods = periods
+        self.bits = bits
+        self.codes = pack_bits(bits) if bits.shape[1] <= 64 else None
+        self.coarse_time = coarse_time
+        self.coarse_signal = coarse_signal
+        self._encodings = None
+        self._complexities = None
+
+    @property
+    def valid(self) -> np.ndarray:
+        return self.status == VALID
+
+    @property
+    def encodings(self) -> List[Optional[str]]:
+        """Encoding strings, None for species without a valid phenotype"""
+        if self._encodings is None:
+            strings = bits_to_strings(self.bits)
+            self._encodings = [s if ok else None for s, ok in zip(strings, self.valid)]
+        return self._encodings
+
+    @property
+    def complexities(self) -> np.ndarray:
+        """CLZ per species, NaN without a valid phenotype (cached, so it survives pickling)"""
+        if self._complexities is None:
+            self._complexities = np.array([CLZ(e) if e is not None else np.nan for e in self.encodings])
+        return self._complexities
+
+    def get(self, species: str) -> Dict:
+        """Phenotype of one species in the same shape as the single-species pipeline"""
+        j = self.species.index(species)
+        encoding = self.encodings[j]
+        coarse = None
+        if self.coarse_time is not None and encoding is not None:
+            coarse = (self.coarse_time[j], self.coarse_signal[j])
+        return {
+            'status': STATUS_NAMES[int(self.status[j])],
+            'encoding': encoding,
+            'complexity': CLZ(encoding) if encoding is not None else None,
+            'period': float(self.periods[j]) if encoding is not None else None,
+            'coarse_data': coarse,
+        }
+
+def encode_species_matrix(time: np.ndarray, Y: np.ndarray, species: Sequence[str],
+                          method: str = "paper", coarse_bins: int = 50, nbins: int = 50,
+                          max_period: Optional[float] = None,
+                          diverge_threshold: Optional[float] = None, instr=None) -> MultiSpeciesPhenotypes:
+    """
+    Phenotypes for every column of a (timepoints x species) result in one pass
+
+    Args:
+        method: "paper" (period detection + coarse-grained cycle, coarse_bins - 1 bits)
+                or "bins" (up_down_encoding over the whole trajectory, nbins bits)
+        max_period: Mark species with longer periods as LONG_PERIOD (paper method)
+        diverge_threshold: Mark species exceeding |value| as DIVERGENT
+        instr: Optional SamplerInstrumentation; times 'estimate_period', 'coarse_grain'
+               and 'up_down_encoding' as separate stages
+    """
+    def stage(name):
+        return instr.stage(name) if instr is not None else nullcontext()
+
+    time = np.asarray(time, dtype=float)
+    Y = np.asarray(Y, dtype=float).reshape(len(time), -1)
+    S = Y.shape[1]
+    status = np.full(S, VALID, dtype=np.int8)
+
+    if method == "bins":
+        with stage('up_down_encoding'):
+            bits = up_down_encoding_matrix(time, Y, nbins)
+        periods = np.full(S, np.nan)
+        coarse_time = coarse_signal = None
+    elif method == "paper":
+        with stage('estimate_period'):
+            periods, cycle_bounds = estimate_period_matrix(time, Y)
+        with stage('coarse_grain'):
+            coarse_time, coarse_signal = coarse_grain_matrix(time, Y, cycle_bounds, coarse_bins)
+        with stage('up_down_encoding'):
+            bits = paper_encoding_matrix(np.nan_to_num(coarse_signal))
+        status[np.isnan(periods)] = NO_OSCILLATION
+        if max_period is not None:
+            status[(status == VALID) & (periods > max_period)] = LONG_PERIOD
+    else:
+        raise ValueError(f"Unknown encoding method: {method}")
+
+    if diverge_threshold is not None:
+        status[np.any(np.abs(Y) > diverge_threshold, axis=0)] = DIVERGENT
+
+    return MultiSpeciesPhenotypes(species, status, periods, bits, coarse_time, coarse_signal)
+
+def simulate_multi_species(rr, species: Optional[Sequence[str]] = None,
+                           tmax: float = 1000, npoints: int = 1001):
+    """
+    One RoadRunner integration returning every requested species
+
+    Args:
+        species: Floating species to keep (None = all floating species)
+
+    Returns:
+        (time, Y, species) or (None, None, species) if the integrator failed
+    """
+    if species is None:
+        species = list(rr.model.getFloatingSpeciesIds())
+    rr.selections = ["time"] + list(species)
+    try:
+        result = rr.simulate(0, tmax, npoints)
+    except RuntimeError:
+        return None, None, species
+    result = np.asarray(result)
+    return result[:, 0], result[:, 1:], species
+
+class MultiSpeciesPhenotypeStore:
+    """Per-species phenotype trackers and live statistics updated together"""
+
+    def __init__(self, species: Sequence[str],
+                 tracker_factory: Optional[Callable[[], PhenotypeTrackerWithRepresentatives]] = PhenotypeTrackerWithRepresentatives,
+                 keep_statistics: bool = True):
+        self.species = list(species)
+        self.trackers = {s: tracker_factory() for s in self.species} if tracker_factory else {}
+        self.stats = {s: LiveSamplingStatistics() for s in self.species} if keep_statistics else {}
+        self.integration_failures = 0
+
+    def update(self, phenotypes: Optional[MultiSpeciesPhenotypes], genotype: Optional[List[float]] = None):
+        """Record one simulation (None if the integration itself failed)"""
+        if phenotypes is None:
+            self.integration_failures += 1
+            for s in self.stats.values():
+                s.record_failure('integrator_failure')
+            return
+
+        encodings = phenotypes.encodings
+        complexities = phenotypes.complexities
+        for j, species in enumerate(phenotypes.species):
+            encoding = encodings[j]
+            if encoding is None:
+                if species in self.stats:
+                    self.stats[species].record_failure(STATUS_NAMES[int(phenotypes.status[j])])
+                continue
+            complexity = float(complexities[j])
+            if species in self.stats:
+                self.stats[species].update(encoding, complexity)
+            if species in self.trackers:
+                coarse = None
+                if phenotypes.coarse_time is not None:
+                    coarse = (phenotypes.coarse_time[j], phenotypes.coarse_signal[j])
+                self.trackers[species].update(encoding, complexity, float(phenotypes.periods[j]),
+                                              genotype=genotype, coarse_data=coarse)
+
+    def summary(self):
+        """Print one line per species"""
+        print(f"\n=== MULTI-SPECIES PHENOTYPES ({len(self.species)} species) ===")
+        print(f"Integration failures: {self.integration_failures:,}")
+        for species, stats in self.stats.items():
+            print(f"   {species:<12} success: {stats.ranks.total_samples:>9,} | {stats.format_progress()}")
+
+if __name__ == "__main__":
+    # Example usage
+    print("encode_species_matrix - phenotypes for all species from one integration")
+    print("time, Y, species = simulate_multi_species(rr)")
+    print("store.update(encode_species_matrix(time, Y, species, max_period=300), genotype)")
@@ -0,0 +1,284 @@
+"""
+Kraikivski 2015 Data Loader and Phenotype Pipeline
+Converts the BuddingYeastCellCycle_2015.m outputs to memory-mapped NumPy arrays once,
+then runs the Chen vectorised up-down encoding / period / CLZ pipeline over every species
+"""
+
+import json
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(DATA_DIR, '..', 'Chen'))
+
+from ChenPipeline import DIVERGENCE_THRESHOLD, MAX_PERIOD_THRESHOLD
+from VectorizedPhenotypes import STATUS_NAMES, VALID, MultiSpeciesPhenotypes, encode_species_matrix
+
+try:
+    import scipy.io as sio
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+# === CONFIGURATION ===
+CACHE_DIR = os.path.join(DATA_DIR, "npy_cache")
+RESAMPLE_DT = 0.1               # Uniform grid spacing (min); the ODE solver output is non-uniform
+# Rejection thresholds default to the Chen pipeline's (MAX_PERIOD_THRESHOLD, DIVERGENCE_THRESHOLD),
+# or to the settings stored in --chen-results, so both models are filtered the same way
+CHEN_SPECIES_MAP = {'CLB2T': 'CLB2'}    # Kraikivski variable -> Chen readout species it is compared with
+
+SOURCES = {
+    'time': "time_data.csv",
+    'species': "species_concentrations.csv",
+    'key_species': "yeast_key_species_timeseries.csv",
+    'names': "species_names.txt",
+    'matlab': "matlab_results.mat",
+}
+
+def _source_signature(path: str) -> Optional[List[float]]:
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+def _save_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+def convert_to_npy(data_dir: str = DATA_DIR, cache_dir: str = CACHE_DIR, force: bool = False) -> Dict:
+    """
+    Parse the CSV / MAT outputs once into .npy files; skipped when the sources are unchanged
+
+    Returns:
+        The manifest describing the cached arrays and their column names
+    """
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    signatures = {key: _source_signature(os.path.join(data_dir, name)) for key, name in SOURCES.items()}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['sources'] == signatures and (manifest['has_matlab'] or not SCIPY_AVAILABLE
+                                                  or signatures['matlab'] is None):
+            return manifest
+
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"Converting Kraikivski outputs in {data_dir} to NumPy arrays...")
+
+    time = np.loadtxt(os.path.join(data_dir, SOURCES['time']), delimiter=',', ndmin=1)
+    species = np.loadtxt(os.path.join(data_dir, SOURCES['species']), delimiter=',', ndmin=2)
+    with open(os.path.join(data_dir, SOURCES['names'])) as f:
+        all_names = [line.strip() for line in f if line.strip()]
+    if species.shape[0] != len(time):
+        raise ValueError(f"{SOURCES['species']} has {species.shape[0]} rows but "
+                         f"{SOURCES['time']} has {len(time)} time points")
+
+    _save_npy(os.path.join(cache_dir, "time.npy"), time)
+    # writematrix(Y) holds the ODE state variables, which come first in allNames
+    _save_npy(os.path.join(cache_dir, "species.npy"), species)
+    manifest = {
+        'sources': signatures,
+        'species_names': all_names[:species.shape[1]],
+        'key_species_names': None,
+        'all_names': None,
+        'has_matlab': False,
+    }
+
+    if signatures['key_species'] is not None:
+        key_path = os.path.join(data_dir, SOURCES['key_species'])
+        with open(key_path) as f:
+            header = f.readline().strip().split(',')
+        key = np.loadtxt(key_path, delimiter=',', skiprows=1, ndmin=2)
+        _save_npy(os.path.join(cache_dir, "key_time.npy"), key[:, 0])
+        _save_npy(os.path.join(cache_dir, "key_species.npy"), key[:, 1:])
+        manifest['key_species_names'] = header[1:]
+
+    if signatures['matlab'] is not None and SCIPY_AVAILABLE:
+        mat_data = sio.loadmat(os.path.join(data_dir, SOURCES['matlab']))
+        _save_npy(os.path.join(cache_dir, "all_time.npy"), mat_data['T'].flatten())
+        _save_npy(os.path.join(cache_dir, "all_values.npy"), mat_data['allValues'])
+        manifest['all_names'] = [str(name[0]) for name in mat_data['allNames'].flatten()]
+        manifest['has_matlab'] = True
+    elif signatures['matlab'] is not None:
+        print(f"scipy not installed: skipping {SOURCES['matlab']} (allValues / algebraic variables)")
+
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    print(f"Cached {len(time):,} time points x {species.shape[1]} species in {cache_dir}")
+    return manifest
+
+class KraikivskiData:
+    """Memory-mapped Kraikivski 2015 trajectories (converted on first use)
+
+    Datasets:
+        'species': ODE state variables from species_concentrations.csv (names from species_names.txt)
+        'key': the seven key species exported by run_yeast_model.m
+        'all': every model variable (allValues) from matlab_results.mat, requires scipy
+    """
+
+    def __init__(self, data_dir: str = DATA_DIR, cache_dir: str = CACHE_DIR, force: bool = False):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.manifest = convert_to_npy(data_dir, cache_dir, force)
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.cache_dir, name), mmap_mode='r')
+
+    @property
+    def datasets(self) -> List[str]:
+        available = ['species']
+        if self.manifest['key_species_names'] is not None:
+            available.append('key')
+        if self.manifest['has_matlab']:
+            available.append('all')
+        return available
+
+    def dataset(self, name: str = "species") -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """(time, Y, names) for one dataset; Y is a read-only (timepoints x variables) memmap"""
+        if name == "species":
+            return self._load("time.npy"), self._load("species.npy"), self.manifest['species_names']
+        if name == "key" and self.manifest['key_species_names'] is not None:
+            return self._load("key_time.npy"), self._load("key_species.npy"), self.manifest['key_species_names']
+        if name == "all" and self.manifest['has_matlab']:
+            return self._load("all_time.npy"), self._load("all_values.npy"), self.manifest['all_names']
+        raise ValueError(f"Dataset '{name}' is not available (available: {self.datasets})")
+
+def resample_uniform(time: np.ndarray, Y: np.ndarray, dt: float = RESAMPLE_DT) -> Tuple[np.ndarray, np.ndarray]:
+    """Interpolate adaptive-step solver output onto a uniform grid (required by the period kernels)"""
+    time = np.asarray(time, dtype=float)
+    grid = np.arange(time[0], time[-1] + dt / 2, dt)
+    Y = np.asarray(Y, dtype=float).reshape(len(time), -1)
+    return grid, np.column_stack([np.interp(grid, time, Y[:, j]) for j in range(Y.shape[1])])
+
+def kraikivski_phenotypes(data: Optional[KraikivskiData] = None, dataset: str = "species",
+                          method: str = "paper", dt: float = RESAMPLE_DT, coarse_bins: int = 50,
+                          nbins: int = 50, max_period: Optional[float] = MAX_PERIOD_THRESHOLD,
+                          diverge_threshold: Optional[float] = DIVERGENCE_THRESHOLD
+                          ) -> MultiSpeciesPhenotypes:
+    """Encode every variable of a dataset with the same kernels as the Chen pipeline"""
+    data = data or KraikivskiData()
+    time, Y, names = data.dataset(dataset)
+    grid, Y_uniform = resample_uniform(time, Y, dt)
+    return encode_species_matrix(grid, Y_uniform, names, method=method, coarse_bins=coarse_bins,
+                                 nbins=nbins, max_period=max_period, diverge_threshold=diverge_threshold)
+
+def print_phenotype_table(phenotypes: MultiSpeciesPhenotypes):
+    """Per-species status, period, CLZ and encoding"""
+    print(f"\n=== KRAIKIVSKI 2015 PHENOTYPES ({len(phenotypes.species)} variables) ===")
+    print(f"{'species':<12} {'status':<15} {'period':>8} {'CLZ':>7}  encoding")
+    print("-" * 100)
+    complexities = phenotypes.complexities
+    for j, (name, encoding) in enumerate(zip(phenotypes.species, phenotypes.encodings)):
+        status = STATUS_NAMES[int(phenotypes.status[j])]
+        if phenotypes.status[j] == VALID:
+            period = phenotypes.periods[j]
+            period_str = f"{period:.1f}" if np.isfinite(period) else "-"
+            print(f"{name:<12} {status:<15} {period_str:>8} {complexities[j]:>7.2f}  {encoding}")
+        else:
+            print(f"{name:<12} {status:<15} {'-':>8} {'-':>7}")
+
+    valid = phenotypes.valid
+    distinct = Counter(e for e in phenotypes.encodings if e is not None)
+    print(f"\nValid: {valid.sum()}/{len(valid)} | distinct encodings: {len(distinct)}")
+    if valid.any():
+        periods = phenotypes.periods[valid & np.isfinite(phenotypes.periods)]
+        period_str = f" | median period: {np.median(periods):.1f} min" if len(periods) else ""
+        print(f"CLZ: {np.mean(complexities[valid]):.3f} ± {np.std(complexities[valid]):.3f}{period_str}")
+
+def compare_with_chen(phenotypes: MultiSpeciesPhenotypes, chen_results: Dict,
+                      species_map: Dict[str, str] = CHEN_SPECIES_MAP, d: int = 3):
+    """
+    Locate mapped Kraikivski phenotypes in the Chen phenotype distribution of the same readout
+
+    Args:
+        chen_results: Pickle written by `python ChenPipeline.py --output results.pkl`
+        species_map: Kraikivski variable -> Chen readout species; unmapped variables are skipped
+        d: Hamming radius for the neighbourhood count
+    """
+    from PhenotypeIndex import PhenotypeHammingIndex
+
+    print(f"\n=== COMPARISON WITH CHEN ({', '.join(chen_results['readout_species'])}) ===")
+    print(f"{'species':<12} {'Chen':<8} {'Chen freq':>10} {'rank':>8} {'nearest d':>10} {'within d=' + str(d):>12}")
+    print("-" * 65)
+    for name, chen_name in species_map.items():
+        if name not in phenotypes.species:
+            print(f"{name:<12} {chen_name:<8} not in this dataset")
+            continue
+        if chen_name not in chen_results['species']:
+            print(f"{name:<12} {chen_name:<8} not a readout species of the Chen run")
+            continue
+        encoding = phenotypes.encodings[phenotypes.species.index(name)]
+        chen_frequencies = chen_results['species'][chen_name]['frequencies']
+        if encoding is None or not chen_frequencies:
+            print(f"{name:<12} {chen_name:<8} no valid phenotype to compare")
+            continue
+        index = PhenotypeHammingIndex.from_counter(chen_frequencies)
+        if len(encoding) != index.n_bits:
+            print(f"{name:<12} {chen_name:<8} {len(encoding)}-bit encoding vs {index.n_bits}-bit Chen encodings")
+            continue
+        counts = np.array(list(chen_frequencies.values()))
+        own = index.frequency(encoding)
+        rank = int((counts > own).sum()) + 1 if own else None
+        nearest = index.nearest(encoding, k=1)
+        nearest_d = nearest[0][1] if nearest else None
+        ball = sum(freq for _, _, freq in index.within(encoding, d))
+        print(f"{name:<12} {chen_name:<8} {own:>10,} {str(rank or '-'):>8} {str(nearest_d):>10} "
+              f"{ball / counts.sum():>12.2e}")
+
+def _species_pair(value: str) -> Tuple[str, str]:
+    kraikivski, _, chen = value.partition('=')
+    if not kraikivski or not chen:
+        raise ValueError(f"Expected KRAIKIVSKI=CHEN, got '{value}'")
+    return kraikivski, chen
+
+def main():
+    import argparse
+    import pickle
+
+    parser = argparse.ArgumentParser(description="Kraikivski 2015 phenotypes with the Chen encoding pipeline")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="Re-parse the CSV / MAT sources")
+    parser.add_argument("--dataset", choices=["species", "key", "all"], default="species")
+    parser.add_argument("--method", choices=["paper", "bins"], default="paper")
+    parser.add_argument("--dt", type=float, default=RESAMPLE_DT)
+    parser.add_argument("--max-period", type=float, default=None,
+                        help=f"Default: the --chen-results run's setting, else {MAX_PERIOD_THRESHOLD}")
+    parser.add_argument("--chen-results", default=None,
+                        help="Pickle written by ChenPipeline.py --output, to compare phenotype statistics")
+    parser.add_argument("--map", nargs="+", type=_species_pair, default=None, metavar="KRAIKIVSKI=CHEN",
+                        help=f"Species compared with the Chen readouts (default: "
+                             f"{' '.join(f'{k}={v}' for k, v in CHEN_SPECIES_MAP.items())})")
+    parser.add_argument("--output", default=None, help="Save phenotypes to this .npz file")
+    args = parser.parse_args()
+
+    chen = None
+    settings = {'max_period': MAX_PERIOD_THRESHOLD, 'diverge_threshold': DIVERGENCE_THRESHOLD}
+    if args.chen_results:
+        with open(args.chen_results, 'rb') as f:
+            chen = pickle.load(f)
+        settings.update(chen.get('settings', {}))
+    max_period = args.max_period if args.max_period is not None else settings['max_period']
+
+    data = KraikivskiData(args.data_dir, args.cache_dir, args.force)
+    phenotypes = kraikivski_phenotypes(data, args.dataset, args.method, args.dt, max_period=max_period,
+                                       diverge_threshold=settings['diverge_threshold'])
+    print_phenotype_table(phenotypes)
+
+    if chen is not None:
+        compare_with_chen(phenotypes, chen, dict(args.map) if args.map else CHEN_SPECIES_MAP)
+
+    if args.output:
+        np.savez(args.output, species=np.array(phenotypes.species), status=phenotypes.status,
+                 period=phenotypes.periods, complexity=phenotypes.complexities,
+                 encoding=np.array(phenotypes.encodings, dtype=object))
+        print(f"Saved phenotypes to {args.output}")
+
+if __name__ == "__main__":
+    main()